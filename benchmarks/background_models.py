@@ -0,0 +1,94 @@
+"""
+Replays a recording through all background-model engines and reports the cost per frame and the detection
+quality, measured as agreement with MOG2 (the engine the pipeline used so far):
+
+    PYTHONPATH=.. python3 ../benchmarks/background_models.py RECORDING [--engines mog2 reference]
+
+Every engine learns the first frames of each camera like BackgroundSubtraction.add_background does and is
+frozen afterwards, so all engines see identical input.
+"""
+import argparse
+import time
+from collections import defaultdict
+
+import numpy as np
+import cv2 as cv
+
+from core.recording import Recording
+from processing.background_models import BACKGROUND_MODELS, create_background_model
+from processing.background_subtraction import BackgroundSubtraction
+
+BASELINE = 'mog2'
+
+
+def streams(image, roi):
+    roi_image = image[roi[1]:roi[1] + roi[3], roi[0]:roi[0] + roi[2]]
+    scaled = cv.resize(roi_image, dsize=(int(roi[2] / 4), int(roi[3] / 4)), interpolation=cv.INTER_NEAREST)
+    return {'roi': roi_image, 'event': scaled}
+
+
+def run_engine(engine, recording, roi, learn_frames, thresh_high):
+    """
+    :return: {stream: (seconds per frame, list of masks, list of event decisions)}
+    """
+    models = {}
+    timings = defaultdict(list)
+    masks = defaultdict(list)
+    events = defaultdict(list)
+    for position in range(len(recording)):
+        for image in recording.read(position).images:
+            for stream, frame in streams(image, roi).items():
+                key = (stream, image.cam_id())
+                if key not in models:
+                    models[key] = create_background_model(engine)
+                if position < learn_frames:
+                    models[key].apply(frame, learningRate=0.5)
+                    continue
+                start = time.perf_counter()
+                mask = models[key].apply(frame, learningRate=0)
+                timings[stream].append(time.perf_counter() - start)
+                masks[stream].append(mask)
+                if stream == 'event':
+                    events[stream].append(np.sum(BackgroundSubtraction.clean_event_mask(mask)) > thresh_high)
+    return {stream: (np.mean(timings[stream]), masks[stream], events[stream]) for stream in timings}
+
+
+def iou(masks, baseline_masks):
+    scores = []
+    for mask, baseline in zip(masks, baseline_masks):
+        union = np.count_nonzero(mask | baseline)
+        if union:
+            scores.append(np.count_nonzero(mask & baseline) / union)
+    return np.mean(scores) if scores else 1.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('recording')
+    parser.add_argument('--engines', nargs='+', default=list(BACKGROUND_MODELS))
+    parser.add_argument('--roi', nargs=4, type=int, default=[50, 350, 1850, 130])
+    parser.add_argument('--learn-frames', type=int, default=5)
+    parser.add_argument('--thresh-high', type=int, default=20000)
+    args = parser.parse_args()
+
+    recording = Recording(args.recording)
+    engines = [BASELINE] + [e for e in args.engines if e != BASELINE]
+    results = {engine: run_engine(engine, recording, args.roi, args.learn_frames, args.thresh_high)
+               for engine in engines}
+
+    print('%-16s %-6s %10s %10s %10s %7s %10s' % ('engine', 'stream', 'ms/frame', 'speedup', 'mask-IoU',
+                                                  'events', 'agreement'))
+    for engine in engines:
+        for stream in ['event', 'roi']:
+            seconds, masks, events = results[engine][stream]
+            base_seconds, base_masks, base_events = results[BASELINE][stream]
+            if stream == 'event':
+                event_info = ('%d' % sum(events), '%.3f' % np.mean(np.equal(events, base_events)))
+            else:
+                event_info = ('', '')
+            print('%-16s %-6s %10.3f %9.1fx %10.3f %7s %10s' % ((engine, stream, seconds * 1000, base_seconds / seconds,
+                                                                iou(masks, base_masks)) + event_info))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+"""
+Replays the throws of a recording through several denoise chains and reports the cost per event and how far
+each chain moves the detected impact points compared to the chain the pipeline used so far:
+
+    PYTHONPATH=.. python3 ../benchmarks/denoise_chains.py RECORDING [--chains open:3,close:3,threshold:5 ...]
+
+The background of each camera is learned from the first frames and frozen afterwards, every frame whose event
+mask exceeds --thresh-high counts as a throw. The impact x-coordinate is picked like FitLine does (with its default
+parameters), but in roi coordinates and without undistortion, alike for every chain.
+"""
+import argparse
+import time
+
+import numpy as np
+import cv2 as cv
+
+from core.datatypes import CVImage
+from core.line_fitting import best_vertical_line
+from core.recording import Recording
+from processing.background_models import create_background_model
+from processing.background_subtraction import BackgroundSubtraction
+from processing.clean_difference import CleanDifference, DEFAULT_DENOISE_CHAIN
+from processing.edge_detection import EdgeDetection
+
+CANDIDATES = [
+    ','.join(DEFAULT_DENOISE_CHAIN),
+    'median:5,open:3,close:3,threshold:5',
+    'box:3,threshold:127,open:3,close:3',
+    'open:3,close:3,threshold:5',
+    'open:3,close:3,area:20',
+    'median:3,area:20',
+]
+
+
+def event_foregrounds(recording, roi, learn_frames, thresh_high, engine):
+    """
+    :return: list of (camera-id, roi foreground) for every camera of every frame that contains an event
+    """
+    models = {}
+    foregrounds = []
+    for position in range(len(recording)):
+        for image in recording.read(position).images:
+            roi_image = image[roi[1]:roi[1] + roi[3], roi[0]:roi[0] + roi[2]]
+            scaled = cv.resize(roi_image, dsize=(int(roi[2] / 4), int(roi[3] / 4)), interpolation=cv.INTER_NEAREST)
+            cam = image.cam_id()
+            if cam not in models:
+                models[cam] = (create_background_model(engine), create_background_model(engine))
+            event_model, roi_model = models[cam]
+            if position < learn_frames:
+                event_model.apply(scaled, learningRate=0.5)
+                roi_model.apply(roi_image, learningRate=0.5)
+                continue
+            event_mask = BackgroundSubtraction.clean_event_mask(event_model.apply(scaled, learningRate=0))
+            if np.sum(event_mask) > thresh_high:
+                foregrounds.append((cam, roi_model.apply(roi_image, learningRate=0)))
+    return foregrounds
+
+
+def impact_x(contours):
+    if contours is None:
+        return None
+    _, a, b, board_y, _ = best_vertical_line(contours.points, contours.offsets, contours.features)
+    return a * board_y + b
+
+
+def run_chain(chain, foregrounds, edge_limit):
+    """
+    :return: (seconds per event, list of impact x-coordinates)
+    """
+    timings = []
+    impacts = []
+    for cam, fg in foregrounds:
+        image = CVImage(fg.copy(), 'benchmark', {'name': cam})
+        start = time.perf_counter()
+        diff = CleanDifference.clean(image, chain)
+        timings.append(time.perf_counter() - start)
+        impacts.append(impact_x(EdgeDetection.find_contours(diff, edge_limit)[1]))
+    return np.mean(timings), impacts
+
+
+def shifts(impacts, baseline_impacts):
+    """
+    :return: (absolute impact shifts where both found a contour, number of events with a changed detection)
+    """
+    found = [(i, b) for i, b in zip(impacts, baseline_impacts) if i is not None and b is not None]
+    changed = sum((i is None) != (b is None) for i, b in zip(impacts, baseline_impacts))
+    return np.abs([i - b for i, b in found]), changed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('recording')
+    parser.add_argument('--chains', nargs='+', default=CANDIDATES,
+                        help='comma-separated steps, the first chain is the baseline')
+    parser.add_argument('--roi', nargs=4, type=int, default=[50, 350, 1850, 130])
+    parser.add_argument('--learn-frames', type=int, default=5)
+    parser.add_argument('--thresh-high', type=int, default=20000)
+    parser.add_argument('--edge-limit', type=int, default=int(1080 / 20))
+    parser.add_argument('--engine', default='mog2')
+    args = parser.parse_args()
+
+    foregrounds = event_foregrounds(Recording(args.recording), args.roi, args.learn_frames, args.thresh_high,
+                                    args.engine)
+    if not foregrounds:
+        parser.exit(1, 'no events found in %s\n' % args.recording)
+    results = {chain: run_chain(chain.split(','), foregrounds, args.edge_limit) for chain in args.chains}
+    base_seconds, base_impacts = results[args.chains[0]]
+
+    print('%d events' % len(foregrounds))
+    print('%-48s %10s %9s %10s %10s %8s' % ('chain', 'ms/event', 'speedup', 'mean-dx', 'max-dx', 'changed'))
+    for chain, (seconds, impacts) in results.items():
+        dx, changed = shifts(impacts, base_impacts)
+        print('%-48s %10.3f %8.1fx %10.2f %10.2f %8d' % (chain, seconds * 1000, base_seconds / seconds,
+                                                        dx.mean() if len(dx) else 0, dx.max() if len(dx) else 0,
+                                                        changed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,40 @@
+from typing import Dict, NamedTuple, Tuple
+
+
+class CalibrationRecord(NamedTuple):
+    """
+    Calibration of one camera, compiled to pixel values for one resolution. Records are immutable and replaced as
+    a whole on every calibration change, so all frames share a reference instead of copying them.
+    """
+    cam_id: int
+    version: int
+    ratios: Tuple[Tuple[str, float], ...]
+    width: int
+    height: int
+    bull: int
+    radius: int
+    board_surface_y: int
+    roi_start_y: int
+    roi_end_y: int
+
+    @classmethod
+    def compile(cls, cam_id: int, version: int, ratios: Dict[str, float], width: int, height: int) \
+            -> 'CalibrationRecord':
+        """
+        :param ratios: the calibration values relative to the image size (see MetaDataWriter.defaults)
+        """
+        return cls(cam_id, version, tuple(sorted(ratios.items())), width, height,
+                   bull=int(width * ratios['bull_location']),
+                   radius=int(width * ratios['board_radius']),
+                   board_surface_y=int(height * ratios['board_surface']),
+                   roi_start_y=int(height * ratios['roi_start']),
+                   roi_end_y=int(height * ratios['roi_end']))
+
+    def ratio_dict(self) -> Dict[str, float]:
+        return dict(self.ratios)
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
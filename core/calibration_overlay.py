@@ -0,0 +1,67 @@
+from functools import lru_cache
+from typing import Tuple
+
+import numpy as np
+import cv2 as cv
+
+from core.constants import RADIUS_OUTER_DOUBLE_MM, RADIUS_INNER_DOUBLE_MM, RADIUS_INNER_TRIPLE_MM, \
+    RADIUS_OUTER_TRIPLE_MM, RADIUS_INNER_BULL_MM, RADIUS_OUTER_BULL_MM
+
+COLOR_BULL = (0, 255, 0)
+COLOR_RINGS = (255, 255, 0)
+COLOR_SURFACE = (0, 255, 0)
+COLOR_ROI_START = (255, 0, 255)
+COLOR_ROI_END = (0, 0, 255)
+
+
+class CalibrationOverlay(object):
+    """
+    The calibration lines of one camera, rendered once into a sparse layer (positions and colours of all line
+    pixels). Compositing it onto a frame only touches those pixels.
+    """
+    def __init__(self, shape: Tuple[int, int], bull_x: int, board_radius: int, board_surface_y: int,
+                 roi_start_y: int = None, roi_end_y: int = None):
+        height, width = shape
+        layer = np.zeros((height, width, 3), np.uint8)
+        # bull-line
+        cv.line(layer, (bull_x, 0), (bull_x, height), COLOR_BULL, 1)
+
+        for l in [RADIUS_OUTER_DOUBLE_MM, RADIUS_INNER_DOUBLE_MM, RADIUS_INNER_TRIPLE_MM,
+                  RADIUS_OUTER_TRIPLE_MM, RADIUS_INNER_BULL_MM, RADIUS_OUTER_BULL_MM]:
+            _x = int(board_radius * (l / RADIUS_OUTER_DOUBLE_MM))
+
+            # ring-line left
+            cv.line(layer, (bull_x - _x, 0), (bull_x - _x, height), COLOR_RINGS, 1)
+            # ring-line right
+            cv.line(layer, (bull_x + _x, 0), (bull_x + _x, height), COLOR_RINGS, 1)
+
+        cv.line(layer, (0, board_surface_y), (width, board_surface_y), COLOR_SURFACE, 1)
+        if roi_start_y is not None:
+            cv.line(layer, (0, roi_start_y), (width, roi_start_y), COLOR_ROI_START, 1)
+        if roi_end_y is not None:
+            cv.line(layer, (0, roi_end_y), (width, roi_end_y), COLOR_ROI_END, 1)
+
+        self.shape = shape
+        self.indices = np.flatnonzero(layer.any(axis=2))
+        self.colors = layer.reshape(-1, 3)[self.indices]
+
+    def apply(self, image: np.ndarray) -> np.ndarray:
+        """
+        draws the overlay onto the image in-place
+        """
+        if image.shape[:2] != self.shape:
+            raise ValueError('overlay of shape %r does not fit image of shape %r' % (self.shape, image.shape))
+        if not image.flags['C_CONTIGUOUS']:
+            raise ValueError('can only draw onto contiguous images')
+        pixels = image.reshape(-1, image.shape[2]) if image.ndim == 3 else image.reshape(-1, 1)
+        pixels[self.indices] = self.colors[:, :pixels.shape[1]]
+        return image
+
+
+@lru_cache(maxsize=32)
+def calibration_overlay(shape: Tuple[int, int], bull_x: int, board_radius: int, board_surface_y: int,
+                        roi_start_y: int = None, roi_end_y: int = None) -> CalibrationOverlay:
+    """
+    :return: the overlay for the given calibration lines, only rendered when the geometry changed
+    """
+    return CalibrationOverlay(shape, bull_x, board_radius, board_surface_y, roi_start_y, roi_end_y)
@@ -0,0 +1,174 @@
+import dill
+import json
+import os
+import time
+from threading import Lock, Event, Thread
+from typing import Callable, Dict, List, Optional, Tuple
+
+from core.calibration import CalibrationRecord
+from core.helper import Shared
+
+CALIBRATION_FILE = 'CALIBRATION.json'
+# pickled dict of defaultdicts, written by older versions
+LEGACY_CALIBRATION_FILE = 'CALIBRATION'
+
+# calibration values relative to the image size (see CalibrationRecord.compile)
+DEFAULT_VALUES = {'bull_location': 0.5, 'board_radius': 0.26, 'board_surface': 0.3, 'roi_start': 0.32,
+                  'roi_end': 0.4}
+DEFAULT_CALIBRATION = {
+    0: {'bull_location': 0.487, 'board_radius': 0.26125, 'board_surface': 0.269, 'roi_start': 0.3, 'roi_end': 0.4},
+    1: {'bull_location': 0.50575, 'board_radius': 0.259, 'board_surface': 0.3, 'roi_start': 0.31, 'roi_end': 0.4},
+}
+
+# callback(cam_id, values, version)
+Subscriber = Callable[[int, Dict[str, float], int], None]
+
+
+class CalibrationStore(Shared):
+    """
+    Calibration values of all cameras, read from memory and persisted in the background.
+    Every update increases the version and replaces the values of the camera as a whole, so readers never see a
+    partial update and never need to copy. Subscribers are notified on the updating thread.
+    Updates are written to disk once no further update arrived for `debounce` seconds (atomically, via rename),
+    so bursts of updates (e.g. from sliders) cause a single write, off the frame path.
+    """
+    def __init__(self, path: Optional[str] = CALIBRATION_FILE, debounce: float = 1.0):
+        """
+        :param path: None for a store that is never persisted
+        """
+        self.path = path
+        self.debounce = debounce
+        self.version = 0
+        self.writes = 0
+        self._values = {cam_id: dict(values) for cam_id, values in DEFAULT_CALIBRATION.items()}
+        self._records = {}
+        self._subscribers = []  # type: List[Subscriber]
+        self._lock = Lock()
+        self._write_lock = Lock()
+        self._writer_lock = Lock()
+        self._changed = Event()
+        self._writer = None
+        self._written_version = None
+
+    @classmethod
+    def create_shared(cls, path: Optional[str] = CALIBRATION_FILE, debounce: float = 1.0) -> 'CalibrationStore':
+        store = cls(path, debounce)
+        store.load()
+        return store
+
+    def release_shared(self):
+        self.flush()
+
+    def load(self) -> bool:
+        """
+        loads the persisted calibration, falls back to the legacy pickle file
+        :return: whether any calibration was found
+        """
+        if self.path is None:
+            return False
+        loaded = None
+        if os.path.exists(self.path):
+            with open(self.path, 'r') as calibration_file:
+                loaded = {int(cam_id): values for cam_id, values in json.load(calibration_file).items()}
+        elif os.path.exists(LEGACY_CALIBRATION_FILE):
+            loaded = self.load_legacy(LEGACY_CALIBRATION_FILE)
+        if loaded is None:
+            return False
+        with self._lock:
+            for cam_id, values in loaded.items():
+                self._values[cam_id] = dict(self.values(cam_id), **values)
+            self.version += 1
+            if os.path.exists(self.path):
+                # a legacy calibration is converted on the next flush
+                self._written_version = self.version
+        return True
+
+    @staticmethod
+    def load_legacy(path: str) -> Dict[int, Dict[str, float]]:
+        # the legacy defaultdicts hold lambdas, which only dill can restore
+        with open(path, 'rb') as calibration_file:
+            defaults = dill.load(calibration_file)
+        calibration = {}
+        for param, cam_values in defaults.items():
+            for cam_id, value in cam_values.items():
+                calibration.setdefault(int(cam_id), {})[param] = value
+        return calibration
+
+    def values(self, cam_id: int) -> Dict[str, float]:
+        """
+        :return: the current values of the camera, never modify them (use update)
+        """
+        return self._values.get(cam_id, DEFAULT_VALUES)
+
+    def snapshot(self) -> Tuple[int, Dict[int, Dict[str, float]]]:
+        with self._lock:
+            return self.version, dict(self._values)
+
+    def record(self, cam_id: int, width: int, height: int) -> CalibrationRecord:
+        """
+        :return: the calibration of the camera compiled for the given resolution, only recompiled after a change
+        """
+        record = self._records.get((cam_id, width, height))
+        if record is None or record.version != self.version:
+            with self._lock:
+                record = CalibrationRecord.compile(cam_id, self.version, self.values(cam_id), width, height)
+                self._records[(cam_id, width, height)] = record
+        return record
+
+    def update(self, cam_id: int, values: Dict[str, float]) -> int:
+        """
+        updates (some of) the values of a camera, notifies all subscribers and schedules the write to disk
+        :return: the new version
+        """
+        with self._lock:
+            self._values[cam_id] = dict(self.values(cam_id), **values)
+            self.version += 1
+            version = self.version
+            current = self._values[cam_id]
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            subscriber(cam_id, current, version)
+        if self.path is not None:
+            self._schedule_write()
+        return version
+
+    def subscribe(self, subscriber: Subscriber):
+        with self._lock:
+            self._subscribers.append(subscriber)
+
+    def unsubscribe(self, subscriber: Subscriber):
+        with self._lock:
+            if subscriber in self._subscribers:
+                self._subscribers.remove(subscriber)
+
+    def _schedule_write(self):
+        self._changed.set()
+        with self._writer_lock:
+            if self._writer is None or not self._writer.is_alive():
+                self._writer = Thread(target=self._write_loop, name='CalibrationStore-writer', daemon=True)
+                self._writer.start()
+
+    def _write_loop(self):
+        while True:
+            self._changed.wait()
+            # wait until the updates stop
+            while self._changed.is_set():
+                self._changed.clear()
+                time.sleep(self.debounce)
+            self.flush()
+
+    def flush(self):
+        """
+        writes the current calibration to disk, if it changed since the last write
+        """
+        with self._write_lock:
+            version, calibration = self.snapshot()
+            if self.path is None or self._written_version == version:
+                return
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w') as calibration_file:
+                json.dump({str(cam_id): values for cam_id, values in calibration.items()}, calibration_file,
+                          indent=2, sort_keys=True)
+            os.replace(tmp_path, self.path)
+            self._written_version = version
+            self.writes += 1
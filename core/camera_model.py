@@ -0,0 +1,80 @@
+import math
+from typing import Dict, Tuple
+
+import numpy as np
+
+from core.calibration import CalibrationRecord
+from core.constants import RADIUS_OUTER_DOUBLE_MM
+from core.undistortion import UndistortionTable
+
+# angle (degrees, image coordinates with y down) of the position of each camera as seen from the bull
+DEFAULT_MOUNT_ANGLES = {0: 180.0, 1: 270.0}
+DEFAULT_CAMERA_DISTANCE_MM = 460.0
+
+
+class CameraModel(object):
+    """
+    Projects image x-coordinates of a camera onto rays on the board plane (mm, bull at the origin).
+    The camera looks at the bull from mount_angle at the given distance, the image x-axis runs along the board
+    perpendicular to the viewing direction, scaled by the calibrated board radius.
+    """
+    def __init__(self, bull_x: float, radius: float, width: int, mount_angle: float,
+                 distance: float = DEFAULT_CAMERA_DISTANCE_MM):
+        alpha = math.radians(mount_angle)
+        # viewing direction and image x-direction on the board
+        self.normal = np.array([-math.cos(alpha), -math.sin(alpha)])
+        self.tangent = np.array([self.normal[1], -self.normal[0]])
+        self.mm_per_pixel = RADIUS_OUTER_DOUBLE_MM / float(radius)
+        self.bull_offset = (bull_x - width / 2.) * self.mm_per_pixel
+        self.bull_x = bull_x
+        self.origin = -distance * self.normal + self.bull_offset * self.tangent
+
+    @classmethod
+    def from_camera_info(cls, camera_info: dict, mount_angles: Dict[int, float] = None,
+                         distance: float = DEFAULT_CAMERA_DISTANCE_MM,
+                         calibration: CalibrationRecord = None) -> 'CameraModel':
+        """
+        :param calibration: defaults to the calibration the frame was annotated with
+        """
+        mount_angles = DEFAULT_MOUNT_ANGLES if mount_angles is None else mount_angles
+        calibration = camera_info['calibration'] if calibration is None else calibration
+        bull_x, radius = calibration.bull, calibration.radius
+        undistortion = UndistortionTable.for_camera(camera_info)
+        if undistortion is not None:
+            # the impact points are undistorted, so must be the calibration lines
+            y = calibration.board_surface_y
+            left, bull, right = undistortion.undistort([[bull_x - radius, y], [bull_x, y], [bull_x + radius, y]])
+            bull_x, radius = bull[0], (right[0] - left[0]) / 2.
+        return cls(bull_x, radius, calibration.width, mount_angles[camera_info['name']], distance)
+
+    def targets(self, image_x) -> np.ndarray:
+        """
+        :return: the point(s) where the rays through the given image x-coordinate(s) cross the line through the
+                 bull, perpendicular to the viewing direction
+        """
+        return np.multiply.outer((np.asarray(image_x, np.float64) - self.bull_x) * self.mm_per_pixel, self.tangent)
+
+    def ray(self, image_x: float) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        :return: origin and unit direction of the ray through the given image x-coordinate
+        """
+        direction = self.targets(image_x) - self.origin
+        return self.origin, direction / np.linalg.norm(direction)
+
+
+def intersect_rays(origins: np.ndarray, directions: np.ndarray, weights: np.ndarray = None) -> np.ndarray:
+    """
+    least-squares intersection of N rays: the point with the smallest (weighted) summed squared distance to all
+    of them
+    :param origins: (N, 2)
+    :param directions: (N, 2) unit vectors
+    """
+    # projections onto the normal space of every ray
+    projections = np.eye(2) - np.einsum('ni,nj->nij', directions, directions)
+    if weights is not None:
+        projections *= np.asarray(weights, np.float64)[:, None, None]
+    a = projections.sum(axis=0)
+    b = np.einsum('nij,nj->i', projections, origins)
+    if abs(np.linalg.det(a)) < 1e-9:
+        raise ValueError('rays do not intersect')
+    return np.linalg.solve(a, b)
@@ -0,0 +1,79 @@
+from typing import List, Sequence
+
+import numpy as np
+
+
+class ContourFeatures(object):
+    """
+    Geometric features of a whole list of contours, computed in one vectorized pass over their packed points:
+    bounding boxes (x, y, w, h), vertical extent, closed arc length, area and principal orientation (radians,
+    0 is horizontal, +-pi/2 vertical). All attributes are arrays with one entry per contour.
+    """
+    def __init__(self, points: np.ndarray, offsets: np.ndarray):
+        """
+        :param points: (N, 2) points of all contours, one after the other
+        :param offsets: (M + 1,) start of each contour in points, followed by N
+        """
+        starts, counts = offsets[:-1], np.diff(offsets)
+        if not len(starts):
+            self._set(np.zeros(0), np.zeros(0), np.zeros(0), np.zeros(0, np.int32), np.zeros((0, 4), np.int32),
+                      np.zeros(0, np.int64))
+            return
+        x, y = points[:, 0].astype(np.int64), points[:, 1].astype(np.int64)
+
+        x_min, x_max = np.minimum.reduceat(x, starts), np.maximum.reduceat(x, starts)
+        y_min, y_max = np.minimum.reduceat(y, starts), np.maximum.reduceat(y, starts)
+        bbox = np.stack([x_min, y_min, x_max - x_min + 1, y_max - y_min + 1], axis=1).astype(np.int32)
+
+        # every point is connected to its successor, the last one of each contour to the first one
+        successor = np.arange(1, len(points) + 1)
+        successor[offsets[1:] - 1] = starts
+        dx, dy = x[successor] - x, y[successor] - y
+        arc_length = np.add.reduceat(np.hypot(dx, dy), starts)
+        area = np.abs(np.add.reduceat(x * y[successor] - x[successor] * y, starts)) / 2
+
+        # second order central moments of the points
+        mean_x, mean_y = np.add.reduceat(x, starts) / counts, np.add.reduceat(y, starts) / counts
+        cx, cy = x - np.repeat(mean_x, counts), y - np.repeat(mean_y, counts)
+        mu20, mu02 = np.add.reduceat(cx * cx, starts), np.add.reduceat(cy * cy, starts)
+        mu11 = np.add.reduceat(cx * cy, starts)
+        orientation = 0.5 * np.arctan2(2 * mu11, mu20 - mu02)
+
+        self._set(arc_length, area, orientation, (y_max - y_min).astype(np.int32), bbox, counts)
+
+    def _set(self, arc_length, area, orientation, v_extent, bbox, point_counts):
+        self.arc_length = arc_length
+        self.area = area
+        self.orientation = orientation
+        self.v_extent = v_extent
+        self.bbox = bbox
+        self.point_counts = point_counts
+
+    @classmethod
+    def of(cls, contours: Sequence[np.ndarray]) -> 'ContourFeatures':
+        """
+        features of OpenCV-style contours ((n, 1, 2) arrays)
+        """
+        counts = [len(c) for c in contours]
+        offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        points = np.concatenate([np.reshape(c, (-1, 2)) for c in contours]) if contours else np.zeros((0, 2))
+        return cls(points, offsets)
+
+    def __len__(self):
+        return len(self.arc_length)
+
+    def select(self, indices) -> 'ContourFeatures':
+        """
+        :return: the features of a subset of the contours (index array or boolean mask)
+        """
+        selected = ContourFeatures.__new__(ContourFeatures)
+        selected._set(self.arc_length[indices], self.area[indices], self.orientation[indices],
+                      self.v_extent[indices], self.bbox[indices], self.point_counts[indices])
+        return selected
+
+    def ranked(self, feature: str = 'arc_length', limit: int = None) -> List[int]:
+        """
+        :return: contour indices, sorted by the given feature in descending order
+        """
+        order = np.argsort(-getattr(self, feature), kind='stable')
+        return order[:limit].tolist()
@@ -1,9 +1,12 @@
 import json
 import uuid
+from copy import deepcopy
 from typing import List, Tuple, Dict, Any, Union
 
 import numpy as np
 
+from core.contour_features import ContourFeatures
+
 
 class AbstractRecognitionDataType(type):
     def __call__(cls, *args, **kwargs):
@@ -14,6 +17,7 @@ class AbstractRecognitionDataType(type):
 
 class RecognitionDataType(object):
     __metaclass__ = AbstractRecognitionDataType
+    __slots__ = ()
     source = None
 
 
@@ -54,22 +58,80 @@ class MultiImage(RecognitionDataType):
 
 
 class Contours(RecognitionDataType):
-    def __init__(self, contours, image_id: str, camera_info: Dict[str, Any]):
+    """
+    All contours of one image, packed into a single int32 (N, 2) point array: contour i is
+    points[offsets[i]:offsets[i + 1]]. Copying and pickling costs one buffer copy, no matter the number of contours.
+    """
+    __slots__ = ('image_id', 'camera_info', 'points', 'offsets', '_features', 'source')
+
+    def __init__(self, contours: List[np.ndarray], image_id: str, camera_info: Dict[str, Any], features=None):
         self.image_id = image_id
-        self.contours = contours
         self.camera_info = camera_info
+        self.points = np.concatenate([np.reshape(c, (-1, 2)) for c in contours]).astype(np.int32, copy=False) \
+            if len(contours) else np.zeros((0, 2), np.int32)
+        self.offsets = np.concatenate([[0], np.cumsum([len(c) for c in contours], dtype=np.int64)])
+        self._features = features
+        self.source = None
+
+    @classmethod
+    def from_packed(cls, points: np.ndarray, offsets: np.ndarray, image_id: str, camera_info: Dict[str, Any],
+                    features=None) -> 'Contours':
+        contours = cls.__new__(cls)
+        contours.image_id = image_id
+        contours.camera_info = camera_info
+        contours.points = points
+        contours.offsets = offsets
+        contours._features = features
+        contours.source = None
+        return contours
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index: int) -> np.ndarray:
+        """
+        :return: a (n, 1, 2) view of a single contour, as returned by cv.findContours
+        """
+        if index < 0:
+            index += len(self)
+        return self.points[self.offsets[index]:self.offsets[index + 1]].reshape(-1, 1, 2)
+
+    @property
+    def contours(self) -> List[np.ndarray]:
+        return [self[i] for i in range(len(self))]
+
+    @property
+    def features(self) -> ContourFeatures:
+        """
+        :return: the features of all contours, computed on first access
+        """
+        if self._features is None:
+            self._features = ContourFeatures(self.points, self.offsets)
+        return self._features
+
+    def __deepcopy__(self, memo):
+        # the features are never modified after their creation and can be shared
+        return Contours.from_packed(self.points.copy(), self.offsets.copy(), self.image_id,
+                                    deepcopy(self.camera_info, memo), self._features)
+
+    def __reduce__(self):
+        return Contours.from_packed, (self.points, self.offsets, self.image_id, self.camera_info, self._features)
 
 
 class ContourCollection(RecognitionDataType):
+    __slots__ = ('collection', 'source')
+
     def __init__(self, contour_collection: List[Contours]):
         self.collection = contour_collection
+        self.source = None
 
 
 class ImpactPoint(RecognitionDataType):
-    def __init__(self, point: Tuple[int, int], image_id: str, camera_info):
+    def __init__(self, point: Tuple[int, int], image_id: str, camera_info, confidence: float = 1.0):
         self.point = point
         self.image_id = image_id
         self.camera_info = camera_info
+        self.confidence = confidence
 
 
 class ImpactPoints(RecognitionDataType):
@@ -95,8 +157,14 @@ class SetBackgroundTrigger(RecognitionDataType):
 
 
 class BoardCoordinate(RecognitionDataType):
-    def __init__(self, point: Tuple[float, float]):
+    def __init__(self, point: Tuple[float, float], segment: int = None, multiplier: int = None):
         self.point = point
+        self.segment = segment
+        self.multiplier = multiplier
+
+    @property
+    def score(self):
+        return None if self.segment is None else self.segment * self.multiplier
 
 
 class CollectionTrigger(RecognitionDataType):
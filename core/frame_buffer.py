@@ -0,0 +1,44 @@
+from collections import deque
+from threading import Lock
+from typing import List, Optional
+
+from core.datatypes import MultiImage
+
+
+class FrameRingBuffer(object):
+    """
+    Thread-safe ring buffer of the most recent MultiImages, indexed by frame id
+    """
+    def __init__(self, max_frames: int = 30):
+        self._frames = deque(maxlen=max_frames)
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self._frames)
+
+    def append(self, multi_image: MultiImage):
+        with self._lock:
+            self._frames.append(multi_image)
+
+    def clear(self):
+        with self._lock:
+            self._frames.clear()
+
+    def pop(self) -> MultiImage:
+        with self._lock:
+            return self._frames.pop()
+
+    def latest(self) -> Optional[MultiImage]:
+        with self._lock:
+            return self._frames[-1] if self._frames else None
+
+    def since(self, frame_id, inclusive: bool = True) -> List[MultiImage]:
+        """
+        :return: all buffered frames recorded after (and including) the frame with the given id
+        """
+        with self._lock:
+            frames = list(self._frames)
+        for position, multi_image in enumerate(frames):
+            if multi_image.images[0].id == frame_id:
+                return frames[position if inclusive else position + 1:]
+        return []
@@ -0,0 +1,72 @@
+from collections import OrderedDict
+from threading import Lock
+from typing import Dict, Optional
+
+from core.datatypes import MultiImage
+from core.helper import Shared
+
+
+class FrameStore(Shared):
+    """
+    Thread-safe store of the most recent frames, keyed by frame id. Modules that only need a few frames
+    (e.g. to draw the result of an event) fetch them here on demand, instead of subscribing to every frame.
+    The least recently used frames are evicted as soon as the byte budget is exceeded.
+    Stored frames are shared between all consumers: never draw onto them without copying first.
+    """
+    def __init__(self, max_bytes: int = 128 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._frames = OrderedDict()
+        self._bytes = 0
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _size(multi_image: MultiImage) -> int:
+        return sum(image.nbytes for image in multi_image.images)
+
+    def put(self, multi_image: MultiImage, frame_id=None):
+        """
+        :param frame_id: defaults to the id of the first image
+        """
+        frame_id = multi_image.images[0].id if frame_id is None else frame_id
+        size = self._size(multi_image)
+        with self._lock:
+            if frame_id in self._frames:
+                self._bytes -= self._size(self._frames.pop(frame_id))
+            self._frames[frame_id] = multi_image
+            self._bytes += size
+            # the newest frame is always kept, even if it exceeds the budget on its own
+            while self._bytes > self.max_bytes and len(self._frames) > 1:
+                _, evicted = self._frames.popitem(last=False)
+                self._bytes -= self._size(evicted)
+                self.evictions += 1
+
+    def get(self, frame_id) -> Optional[MultiImage]:
+        with self._lock:
+            multi_image = self._frames.get(frame_id)
+            if multi_image is None:
+                self.misses += 1
+                return None
+            self._frames.move_to_end(frame_id)
+            self.hits += 1
+            return multi_image
+
+    def __contains__(self, frame_id):
+        with self._lock:
+            return frame_id in self._frames
+
+    def __len__(self):
+        with self._lock:
+            return len(self._frames)
+
+    def clear(self):
+        with self._lock:
+            self._frames.clear()
+            self._bytes = 0
+
+    def metrics(self) -> Dict[str, int]:
+        with self._lock:
+            return {'frames': len(self._frames), 'bytes': self._bytes, 'hits': self.hits, 'misses': self.misses,
+                    'evictions': self.evictions}
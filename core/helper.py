@@ -1,11 +1,14 @@
 import datetime
+import hashlib
 import logging
 import os
 import re
 import sys
 import cv2 as cv
+import numpy as np
 from enum import Enum
-from typing import Dict, Union, List
+from threading import Lock
+from typing import Callable, Dict, Union, List
 
 from termcolor import colored
 
@@ -164,6 +167,62 @@ class PropertyObject(object):
             super.__setattr__(self, key, value)
 
 
+class Shared(object):
+    """
+    Process-wide instance of a class: shared() creates it on first use, configure(...) replaces it by an instance
+    created with the given arguments. Subclasses customize the creation in create_shared and the disposal of a
+    replaced instance in release_shared.
+    """
+    _shared = None
+    _shared_lock = Lock()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._shared = None
+        cls._shared_lock = Lock()
+
+    @classmethod
+    def create_shared(cls, *args, **kwargs):
+        return cls(*args, **kwargs)
+
+    def release_shared(self):
+        pass
+
+    @classmethod
+    def shared(cls):
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls.create_shared()
+            return cls._shared
+
+    @classmethod
+    def configure(cls, *args, **kwargs):
+        instance = cls.create_shared(*args, **kwargs)
+        with cls._shared_lock:
+            old, cls._shared = cls._shared, instance
+        if old is not None:
+            old.release_shared()
+
+
+def cache_path(name: str, key: str, directory: str = '.') -> str:
+    """
+    :param key: everything the cached data depends on, the file name changes with it
+    """
+    return os.path.join(directory, '%s_%s.npy' % (name, hashlib.sha1(key.encode()).hexdigest()[:12]))
+
+
+def cached_array(name: str, key: str, build: Callable[[], np.ndarray], directory: str = '.') -> np.ndarray:
+    """
+    :return: the array returned by build, cached on disk (written atomically) and memory-mapped read-only
+    """
+    path = cache_path(name, key, directory)
+    if not os.path.exists(path):
+        tmp_path = path + '.tmp.npy'
+        np.save(tmp_path, build())
+        os.replace(tmp_path, path)
+    return np.load(path, mmap_mode='r')
+
+
 def update_func(_o, _p, _c, _min_v, _max_v, _s):
     return lambda v, o=_o, p=_p, c=_c, max_v=_max_v, min_v=_min_v, s=_s: \
         setattr(o, '%s_%s' % (p, c), (v * ((max_v - min_v) / s)) + min_v)
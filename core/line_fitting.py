@@ -0,0 +1,79 @@
+from typing import Tuple
+
+import numpy as np
+
+
+def gather(offsets: np.ndarray, indices: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    :return: the positions of all points of the given contours in the packed point array and the index (into
+             indices) of the contour each of them belongs to
+    """
+    starts = offsets[indices]
+    counts = offsets[indices + 1] - starts
+    labels = np.repeat(np.arange(len(indices)), counts)
+    first = np.repeat(np.cumsum(counts) - counts, counts)
+    return np.repeat(starts, counts) + np.arange(counts.sum()) - first, labels
+
+
+def fit_vertical_lines(points: np.ndarray, offsets: np.ndarray, indices, iterations: int = 3,
+                       huber: float = 1.5) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Fits x = a * y + b to several packed contours at once (x as a function of y, since darts are close to vertical).
+    Iteratively reweighted least squares with Huber weights make the fits robust against the flight and against
+    points of the board.
+    :param indices: the contours to fit
+    :return: arrays a, b and the rms residual (in pixels) of every fit
+    """
+    indices = np.asarray(indices, dtype=np.int64)
+    positions, labels = gather(offsets, indices)
+    x = points[positions, 0].astype(np.float64)
+    y = points[positions, 1].astype(np.float64)
+    k = len(indices)
+
+    weights = np.ones_like(x)
+    for iteration in range(iterations + 1):
+        sw = np.bincount(labels, weights, k)
+        sx, sy = np.bincount(labels, weights * x, k), np.bincount(labels, weights * y, k)
+        sxy, syy = np.bincount(labels, weights * x * y, k), np.bincount(labels, weights * y * y, k)
+        det = sw * syy - sy * sy
+        # contours without any vertical extent become a vertical line through their center
+        flat = np.abs(det) < 1e-9
+        a = np.where(flat, 0.0, (sw * sxy - sy * sx) / np.where(flat, 1.0, det))
+        b = (sx - a * sy) / sw
+
+        residuals = np.abs(x - (a[labels] * y + b[labels]))
+        if iteration == iterations:
+            break
+        # mean absolute deviation of each fit as a scale estimate
+        scale = np.bincount(labels, residuals, k) / np.bincount(labels, minlength=k)
+        limit = huber * np.maximum(scale, 0.5)[labels]
+        weights = np.minimum(1.0, limit / np.maximum(residuals, 1e-9))
+
+    rms = np.sqrt(np.bincount(labels, weights * residuals ** 2, k) / np.bincount(labels, weights, k))
+    return a, b, rms
+
+
+def best_vertical_line(points: np.ndarray, offsets: np.ndarray, features, candidates: int = 5,
+                       residual_scale: float = 5.0) -> Tuple[int, float, float, float, float]:
+    """
+    fits lines to the longest contours at once and picks the longest one that is straight and close to vertical
+    :param features: the ContourFeatures of the contours
+    :param candidates: number of contours (longest first) that are fitted
+    :param residual_scale: rms residual (in pixels) at which the quality of a fit has dropped to 1/e
+    :return: index of the picked contour, its line x = a * y + b, the y-coordinate of its top end and the confidence
+    """
+    candidates = np.asarray(features.ranked('arc_length', limit=candidates))
+    a, b, rms = fit_vertical_lines(points, offsets, candidates)
+
+    verticality = 1 / np.sqrt(1 + a * a)
+    quality = verticality * np.exp(-rms / residual_scale)
+    scores = quality * features.v_extent[candidates]
+    order = np.argsort(-scores, kind='stable')
+    best = order[0]
+    # a clear winner is more trustworthy than the best of several similar candidates
+    margin = 1 - scores[order[1]] / scores[best] if len(order) > 1 and scores[best] > 0 else 1.0
+    confidence = float(quality[best] * (0.5 + 0.5 * margin))
+
+    index = int(candidates[best])
+    top_y = points[offsets[index]:offsets[index + 1], 1].min()
+    return index, float(a[best]), float(b[best]), float(top_y), confidence
@@ -13,7 +13,7 @@ import cv2 as cv
 from collections import deque
 from copy import deepcopy
 from threading import Thread, Lock
-from typing import List, Iterable, Type
+from typing import Callable, List, Iterable, Type
 
 from termcolor import colored
 
@@ -436,8 +436,17 @@ class Output(ConnectionNode):
     """
        A Generic Module Output Node
     """
-    def __init__(self, data_type: Type[RecognitionDataType], config_keys: List[str] = None):
+    def __init__(self, data_type: Type[RecognitionDataType], config_keys: List[str] = None,
+                 debug: bool = False, max_fps: float = 5.0):
+        """
+        :param debug: debug outputs are only rendered while connected and at most at max_fps, see data_ready_lazy
+        :param max_fps: frame rate limit of a debug output (0 or None: unlimited), ignored by all other outputs
+        """
         super().__init__(data_type, config_keys)
+        self.debug = debug
+        self.max_fps = max_fps
+        self._last_debug_emit = 0.0
+        self._debug_lock = Lock()
 
     def connect(self, input_connection: 'Input'):
         """
@@ -503,6 +512,34 @@ class Output(ConnectionNode):
         for connection in self._registered_connections:
             connection.add_to_data_queue(deepcopy(data), self.module)
 
+    def is_requested(self) -> bool:
+        """
+        :return: whether data published now would be relayed, debug outputs also have to respect their frame rate
+        """
+        if not self.is_connected():
+            return False
+        if not self.debug:
+            return True
+        return not self.max_fps or time.time() - self._last_debug_emit >= 1.0 / self.max_fps
+
+    def data_ready_lazy(self, render: Callable[[], RecognitionDataType]) -> bool:
+        """
+        relays the data returned by render, which is only called if the output is requested
+        :return: whether anything was rendered
+        """
+        with self._debug_lock:
+            if not self.is_requested():
+                return False
+            self._last_debug_emit = time.time()
+        self.data_ready(render())
+        return True
+
+    def get_max_queue_size(self):
+        """
+        :return: the longest input-queue of all connected modules
+        """
+        return max([connection.get_queue_size() for connection in self._registered_connections], default=0)
+
     def relay(self, output: 'Output'):
         self._relay_connections.append(output)
         for connection in self._registered_connections:
@@ -0,0 +1,42 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, List, Any
+
+from core.datatypes import MultiImage
+from core.helper import Shared
+
+
+class CameraExecutor(Shared):
+    """
+    Thread-pool shared by all modules to process the per-camera images of a MultiImage concurrently.
+    Most of the per-camera work happens inside OpenCV, which releases the GIL.
+    """
+    def __init__(self, max_workers: int):
+        self.max_workers = max_workers
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='CameraExecutor')
+
+    @classmethod
+    def create_shared(cls, max_workers: int = None) -> 'CameraExecutor':
+        return cls(max_workers or os.cpu_count() or 4)
+
+    def release_shared(self):
+        self.shutdown(wait=False)
+
+    def map(self, func: Callable[[Any], Any], items: Iterable[Any]) -> List[Any]:
+        """
+        applies func to all items concurrently and returns the results in order.
+        the calling thread processes the first item itself instead of idling
+        """
+        items = list(items)
+        if len(items) < 2:
+            return [func(item) for item in items]
+        futures = [self._pool.submit(func, item) for item in items[1:]]
+        results = [func(items[0])]
+        results.extend(future.result() for future in futures)
+        return results
+
+    def map_images(self, func: Callable, multi_image: MultiImage) -> MultiImage:
+        return MultiImage(self.map(func, multi_image.images), multi_image.has_processing_trigger)
+
+    def shutdown(self, wait: bool = True):
+        self._pool.shutdown(wait=wait)
@@ -0,0 +1,122 @@
+import os
+import pickle
+import sys
+from typing import List
+
+import numpy as np
+
+from core.datatypes import CVImage, MultiImage
+
+INDEX_FILE = 'index.npy'
+DATA_FILE = 'frames.bin'
+
+# the old pickled IMAGES files carry no timestamps, they were replayed at 4 fps
+LEGACY_FRAME_RATE = 4.0
+
+INDEX_DTYPE = np.dtype([('frame', '<i8'),
+                        ('id', 'S36'),
+                        ('cam', '<i4'),
+                        ('ts', '<f8'),
+                        ('offset', '<i8'),
+                        ('height', '<i4'),
+                        ('width', '<i4'),
+                        ('channels', '<i4')])
+
+
+class Recording(object):
+    """
+    Read-only access to an indexed recording (a directory holding an index and one raw frame file).
+    Frame data is memory-mapped, so only the frames that are actually read are paged in.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.index = np.load(os.path.join(path, INDEX_FILE), mmap_mode='r')
+        self.data = np.memmap(os.path.join(path, DATA_FILE), dtype=np.uint8, mode='r')
+
+        frames = self.index['frame']
+        starts = np.flatnonzero(np.r_[True, frames[1:] != frames[:-1]])
+        self._bounds = np.r_[starts, len(self.index)]
+        self.timestamps = np.array(self.index['ts'][starts])
+        self.frame_ids = np.array(self.index['id'][starts])
+        self.cam_ids = sorted(set(int(c) for c in self.index['cam']))
+
+    def __len__(self):
+        return len(self._bounds) - 1
+
+    def duration(self):
+        return float(self.timestamps[-1] - self.timestamps[0]) if len(self) else 0.0
+
+    def find_frame(self, frame_id: str) -> int:
+        hits = np.flatnonzero(self.frame_ids == str(frame_id).encode())
+        if not hits.size:
+            raise KeyError('frame %s is not part of recording %s' % (frame_id, self.path))
+        return int(hits[0])
+
+    def find_time(self, seconds: float) -> int:
+        """
+        :param seconds: time relative to the first frame of the recording
+        :return: position of the first frame recorded at or after that time
+        """
+        position = int(np.searchsorted(self.timestamps, self.timestamps[0] + seconds))
+        return min(position, len(self) - 1)
+
+    def read(self, position: int) -> MultiImage:
+        images = []
+        for entry in self.index[self._bounds[position]:self._bounds[position + 1]]:
+            shape = (entry['height'], entry['width']) if entry['channels'] == 0 \
+                else (entry['height'], entry['width'], entry['channels'])
+            size = int(np.prod(shape))
+            frame = self.data[entry['offset']:entry['offset'] + size].reshape(shape)
+            images.append(CVImage(frame, entry['id'].decode(), {'name': int(entry['cam']), 'ts': float(entry['ts'])}))
+        return MultiImage(images)
+
+
+class RecordingWriter(object):
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self._data_file = open(os.path.join(path, DATA_FILE), 'wb')
+        self._entries = []
+        self._frame_count = 0
+
+    def write(self, multi_image: MultiImage, ts: float = None):
+        for image in multi_image.images:
+            frame = np.ascontiguousarray(image, dtype=np.uint8)
+            offset = self._data_file.tell()
+            self._data_file.write(frame.data)
+            image_ts = ts if ts is not None else image.camera_info.get('ts', self._frame_count / LEGACY_FRAME_RATE)
+            self._entries.append((self._frame_count, str(image.id), image.camera_info['name'], image_ts, offset,
+                                  frame.shape[0], frame.shape[1], frame.shape[2] if frame.ndim == 3 else 0))
+        self._frame_count += 1
+
+    def close(self):
+        self._data_file.close()
+        np.save(os.path.join(self.path, INDEX_FILE), np.array(self._entries, dtype=INDEX_DTYPE))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def convert_pickle_recording(pickle_path: str, path: str):
+    """
+    converts the old pickled list of {'image', 'id', 'camera_info'} dicts into an indexed recording
+    """
+    with open(pickle_path, 'rb') as bg_file:
+        data = pickle.load(bg_file)
+
+    with RecordingWriter(path) as writer:
+        images = []  # type: List[CVImage]
+        for f in data:
+            if images and images[0].id != f['id']:
+                writer.write(MultiImage(images))
+                images = []
+            images.append(CVImage(f['image'], f['id'], f['camera_info']))
+        if images:
+            writer.write(MultiImage(images))
+
+
+if __name__ == '__main__':
+    convert_pickle_recording(sys.argv[1], sys.argv[2])
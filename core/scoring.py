@@ -0,0 +1,79 @@
+import math
+from typing import Tuple, Union
+
+import numpy as np
+
+from core.constants import RADIUS_INNER_BULL_MM, RADIUS_OUTER_BULL_MM, RADIUS_INNER_TRIPLE_MM, \
+    RADIUS_OUTER_TRIPLE_MM, RADIUS_INNER_DOUBLE_MM, RADIUS_OUTER_DOUBLE_MM, FIELDS
+from core.helper import Shared, cache_path, cached_array
+
+BULL = 25
+# codes of the raster: segment * CODE_FACTOR + multiplier
+CODE_FACTOR = 4
+
+
+class ScoreRaster(Shared):
+    """
+    Segment and multiplier of every cell of the board, precomputed from core.constants. Board coordinates are in mm,
+    with the origin in the top-left corner of the square around the outer double ring (like BoardCoordinate).
+    The raster is cached on disk and memory-mapped, scoring any number of throws is a single array lookup.
+    """
+    def __init__(self, codes: np.ndarray, resolution: float):
+        self.codes = codes
+        self.resolution = resolution
+
+    @classmethod
+    def create_shared(cls, resolution: float = 0.25, directory: str = '.') -> 'ScoreRaster':
+        return cls.load(resolution, directory)
+
+    @staticmethod
+    def cache_key(resolution: float) -> str:
+        # the file name changes with the board geometry, a stale raster is never loaded
+        return repr((RADIUS_INNER_BULL_MM, RADIUS_OUTER_BULL_MM, RADIUS_INNER_TRIPLE_MM, RADIUS_OUTER_TRIPLE_MM,
+                     RADIUS_INNER_DOUBLE_MM, RADIUS_OUTER_DOUBLE_MM, FIELDS, resolution))
+
+    @staticmethod
+    def cache_path(resolution: float, directory: str = '.') -> str:
+        return cache_path('SCORE_RASTER', ScoreRaster.cache_key(resolution), directory)
+
+    @classmethod
+    def load(cls, resolution: float = 0.25, directory: str = '.') -> 'ScoreRaster':
+        return cls(cached_array('SCORE_RASTER', cls.cache_key(resolution), lambda: cls.build(resolution), directory),
+                   resolution)
+
+    @staticmethod
+    def build(resolution: float) -> np.ndarray:
+        size = int(math.ceil(2 * RADIUS_OUTER_DOUBLE_MM / resolution))
+        centers = (np.arange(size, dtype=np.float64) + 0.5) * resolution - RADIUS_OUTER_DOUBLE_MM
+        x, y = np.meshgrid(centers, centers)
+        radius = np.hypot(x, y)
+
+        # image coordinates (y down): the field FIELDS[i] is centered at the angle (i - 6) * sector_angle
+        sector_angle = 2 * math.pi / 20
+        sectors = np.floor(np.arctan2(y, x) / sector_angle + 6 + 0.5).astype(np.int64) % 20
+        segments = np.asarray(FIELDS, np.uint8)[sectors]
+        multipliers = np.ones_like(segments)
+        multipliers[(radius > RADIUS_INNER_TRIPLE_MM) & (radius <= RADIUS_OUTER_TRIPLE_MM)] = 3
+        multipliers[(radius > RADIUS_INNER_DOUBLE_MM) & (radius <= RADIUS_OUTER_DOUBLE_MM)] = 2
+        segments[radius <= RADIUS_OUTER_BULL_MM] = BULL
+        multipliers[radius <= RADIUS_INNER_BULL_MM] = 2
+
+        codes = segments * CODE_FACTOR + multipliers
+        codes[radius > RADIUS_OUTER_DOUBLE_MM] = 0
+        return codes.astype(np.uint8)
+
+    def lookup(self, x: Union[float, np.ndarray], y: Union[float, np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        :param x, y: board coordinates in mm, scalars or arrays
+        :return: segment and multiplier (0 and 0 off the board)
+        """
+        col = np.floor(np.asarray(x, np.float64) / self.resolution).astype(np.int64)
+        row = np.floor(np.asarray(y, np.float64) / self.resolution).astype(np.int64)
+        size = self.codes.shape[0]
+        inside = (col >= 0) & (col < size) & (row >= 0) & (row < size)
+        codes = np.where(inside, self.codes[np.clip(row, 0, size - 1), np.clip(col, 0, size - 1)], 0)
+        return codes // CODE_FACTOR, codes % CODE_FACTOR
+
+    def score(self, x: Union[float, np.ndarray], y: Union[float, np.ndarray]) -> np.ndarray:
+        segments, multipliers = self.lookup(x, y)
+        return segments * multipliers
@@ -0,0 +1,85 @@
+import hashlib
+import json
+from threading import Lock
+from typing import Any, Dict, Optional
+
+import numpy as np
+import cv2 as cv
+
+from core.helper import cached_array
+
+INTRINSICS_FILE = 'INTRINSICS'
+
+
+def load_intrinsics(path: str = INTRINSICS_FILE) -> Dict[int, Dict[str, Any]]:
+    """
+    :return: {cam_id: {'camera_matrix': 3x3, 'dist_coeffs': [k1, k2, p1, p2, k3], 'image_size': [w, h]}}
+    """
+    with open(path, 'r') as intrinsics_file:
+        return {int(cam_id): intrinsics for cam_id, intrinsics in json.load(intrinsics_file).items()}
+
+
+def intrinsics_hash(intrinsics: Dict[str, Any]) -> str:
+    return hashlib.sha1(json.dumps(intrinsics, sort_keys=True).encode()).hexdigest()[:12]
+
+
+class UndistortionTable(object):
+    """
+    Undistorted pixel position of every pixel of a camera, so that single points (e.g. of fitted lines) can be
+    undistorted by a bilinear lookup instead of undistorting whole frames.
+    The table is cached on disk per set of intrinsics and memory-mapped.
+    """
+    _tables = {}
+    _tables_lock = Lock()
+
+    def __init__(self, table: np.ndarray):
+        self.table = table
+
+    @staticmethod
+    def for_camera(camera_info: dict) -> Optional['UndistortionTable']:
+        """
+        :return: the table for the intrinsics in camera_info, None for cameras without intrinsics
+        """
+        intrinsics = camera_info.get('intrinsics')
+        if intrinsics is None:
+            return None
+        key = intrinsics_hash(intrinsics)
+        with UndistortionTable._tables_lock:
+            if key not in UndistortionTable._tables:
+                UndistortionTable._tables[key] = UndistortionTable.load(intrinsics)
+            return UndistortionTable._tables[key]
+
+    @classmethod
+    def load(cls, intrinsics: Dict[str, Any], directory: str = '.') -> 'UndistortionTable':
+        return cls(cached_array('UNDISTORTION', json.dumps(intrinsics, sort_keys=True),
+                                lambda: cls.build(intrinsics), directory))
+
+    @staticmethod
+    def build(intrinsics: Dict[str, Any]) -> np.ndarray:
+        """
+        :return: (h, w, 2) float32 table of undistorted pixel coordinates
+        """
+        width, height = intrinsics['image_size']
+        camera_matrix = np.asarray(intrinsics['camera_matrix'], np.float64)
+        dist_coeffs = np.asarray(intrinsics['dist_coeffs'], np.float64)
+        x, y = np.meshgrid(np.arange(width, dtype=np.float32), np.arange(height, dtype=np.float32))
+        pixels = np.stack([x.ravel(), y.ravel()], axis=1).reshape(-1, 1, 2)
+        undistorted = cv.undistortPoints(pixels, camera_matrix, dist_coeffs, P=camera_matrix)
+        return undistorted.reshape(height, width, 2).astype(np.float32)
+
+    def undistort(self, points: np.ndarray) -> np.ndarray:
+        """
+        :param points: (N, 2) pixel coordinates, points outside the image are clamped to its border
+        :return: (N, 2) undistorted coordinates (float64)
+        """
+        height, width = self.table.shape[:2]
+        points = np.asarray(points, np.float64)
+        x = np.clip(points[:, 0], 0, width - 1)
+        y = np.clip(points[:, 1], 0, height - 1)
+        x0 = np.minimum(x.astype(np.int64), width - 2)
+        y0 = np.minimum(y.astype(np.int64), height - 2)
+        fx, fy = (x - x0)[:, None], (y - y0)[:, None]
+        table = self.table
+        top = table[y0, x0] * (1 - fx) + table[y0, x0 + 1] * fx
+        bottom = table[y0 + 1, x0] * (1 - fx) + table[y0 + 1, x0 + 1] * fx
+        return top * (1 - fy) + bottom * fy
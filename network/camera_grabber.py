@@ -12,6 +12,7 @@ from pyv4l2.control import Control
 from core.helper import ModuleParameter
 from core.module import Module, Output, Thread, time, Input
 from core.datatypes import CVImage, MultiImage, CollectionTrigger, JsonObject
+from core.frame_buffer import FrameRingBuffer
 
 CTRL_BACK_LIGHT_COMPENSATION = 9963804
 CTRL_AUTO_WHITE_BALANCE = 9963788
@@ -44,7 +45,8 @@ class CameraGrabber(Module):
         self.event_camera = ModuleParameter(1)
         self.cameras = OrderedDict()  # type: OrderedDict[int, Camera]
 
-        self.collected_images = deque(maxlen=5)
+        # recent frames, queryable by frame id or time range
+        self.collected_images = FrameRingBuffer(max_frames=5)
 
     def configure(self, cam_ids: List[int] = None):
         self._configure(locals())
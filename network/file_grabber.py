@@ -1,52 +1,130 @@
-import pickle
-import uuid
-
-import numpy as np
+import os
+from threading import Lock
 
 from core.helper import ModuleParameter
-from core.module import Module, Output, os, Thread, time
-from core.datatypes import CVImage
+from core.module import Module, Output, Thread, time
+from core.datatypes import MultiImage
+from core.recording import Recording, convert_pickle_recording
+
+# pickled recording written by older versions, converted on first use
+LEGACY_RECORDING_FILE = 'IMAGES'
 
 
 class FileGrabber(Module):
     def __init__(self):
         super().__init__()
-        self.image_out = Output(data_type=CVImage, config_keys=['cam_ids'])
-        self.reader_thread = Thread(target=self.collect)
+        self.images_out = Output(data_type=MultiImage, config_keys=['cam_ids'])
+        self.reader_thread = Thread(target=self.replay)
         self.reader_thread.setDaemon(True)
-        self.frame_rate = 4.0
-        self.data = None
         self.running = False
-        self.data = []
+        self.recording = None  # type: Recording
+        self.position = 0
+        self.seek_lock = Lock()
+        # increased on every seek, so that the replay does not pace over the skipped frames
+        self.seek_generation = 0
 
         self.cam_ids = ModuleParameter([0, 1], data_type=list)
-        self.image_out.emit_configuration({'cam_ids': self.cam_ids})
+        self.recording_path = ModuleParameter('RECORDING')
+        # 1.0 replays at recorded speed, 0.0 replays as fast as the consumers accept the frames
+        self.speed = ModuleParameter(1.0, data_type=float)
+        self.loop = ModuleParameter(True)
+        self.start_frame = ModuleParameter(0)
+        # a negative end_frame replays up to the end of the recording
+        self.end_frame = ModuleParameter(-1)
+        self.max_consumer_queue = ModuleParameter(1)
+        self.images_out.emit_configuration({'cam_ids': self.cam_ids})
+
+    def configure(self,
+                  recording_path: str = None,
+                  speed: float = None,
+                  loop: bool = None,
+                  start_frame: int = None,
+                  end_frame: int = None):
+        self._configure(locals())
+
+    def _range_end(self):
+        return len(self.recording) if self.end_frame < 0 else min(self.end_frame, len(self.recording))
+
+    def seek_frame(self, frame_id: str):
+        with self.seek_lock:
+            self.position = self.recording.find_frame(frame_id)
+            self.seek_generation += 1
+
+    def seek_time(self, seconds: float):
+        with self.seek_lock:
+            self.position = self.recording.find_time(seconds)
+            self.seek_generation += 1
 
-    def collect(self):
+    def set_range(self, start_frame: int, end_frame: int = -1, loop: bool = True):
+        with self.seek_lock:
+            self.start_frame = start_frame
+            self.end_frame = end_frame
+            self.loop = loop
+            self.position = start_frame
+            self.seek_generation += 1
+
+    def wait_for_consumers(self):
+        while self.running and self.images_out.get_max_queue_size() >= self.max_consumer_queue:
+            time.sleep(0.001)
+
+    def replay(self):
+        last_ts = None
+        last_emit = None
+        generation = self.seek_generation
         while self.running:
-            for f in self.data:
-                if self.running:
-                    self.image_out.data_ready(f)
-                    time.sleep(1.0/self.frame_rate)
-                else:
-                    break
+            with self.seek_lock:
+                if generation != self.seek_generation:
+                    generation = self.seek_generation
+                    last_ts = None
+                if not self.start_frame <= self.position < self._range_end():
+                    if not self.loop and self.position >= self._range_end():
+                        self.log_debug('end of recording reached')
+                        break
+                    self.position = self.start_frame
+                    last_ts = None
+                position = self.position
+                self.position += 1
+
+            multi_image = self.recording.read(position)
+            ts = self.recording.timestamps[position]
+            if self.speed > 0:
+                if last_ts is not None:
+                    delay = (ts - last_ts) / self.speed - (time.time() - last_emit)
+                    if delay > 0:
+                        time.sleep(delay)
+            else:
+                self.wait_for_consumers()
+            last_ts = ts
+            last_emit = time.time()
+            self.images_out.data_ready(multi_image)
+
+    def open_recording(self) -> Recording:
+        """
+        opens the indexed recording, a legacy pickle file (at recording_path or the old default location) is
+        converted into an indexed recording first
+        """
+        path = self.recording_path
+        legacy_path = None
+        if os.path.isfile(path):
+            legacy_path, path = path, path + '_RECORDING'
+        elif not os.path.exists(path) and os.path.isfile(LEGACY_RECORDING_FILE):
+            legacy_path = LEGACY_RECORDING_FILE
+        if legacy_path is not None and not os.path.isdir(path):
+            self.log_info('converting legacy recording', legacy_path, 'to', path)
+            tmp_path = path + '.tmp'
+            convert_pickle_recording(legacy_path, tmp_path)
+            os.replace(tmp_path, path)
+        if not os.path.isdir(path):
+            raise FileNotFoundError('no recording found at %s' % path)
+        return Recording(path)
 
     def __start__(self):
-        with open('IMAGES', 'rb') as bg_file:
-            data = pickle.load(bg_file)
-
-            self.log_debug('loading images...')
-            self.data = []
-            for f in data:
-                image = f['image']
-                image.id = f['id']
-                image.camera_info = f['camera_info']
-                self.data.append(image)
-
-        self.log_debug('loaded', len(self.data), 'images from file')
+        self.recording = self.open_recording()
+        self.log_debug('loaded', len(self.recording), 'frames (%.1fs) of cameras' % self.recording.duration(),
+                       self.recording.cam_ids, 'from', self.recording_path)
+        self.position = self.start_frame
         self.running = True
         self.reader_thread.start()
 
     def __stop__(self):
         self.running = False
-
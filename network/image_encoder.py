@@ -0,0 +1,104 @@
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from threading import Lock
+from typing import List, NamedTuple, Tuple
+
+import cv2 as cv
+import numpy as np
+import paho.mqtt.client as mqtt
+
+
+class EncodingSettings(NamedTuple):
+    """
+    :param format: 'jpg', 'png' or 'webp'
+    :param quality: 0-100 for jpg and webp, png is always lossless (and compressed fast)
+    :param scale: downscale factor applied before encoding
+    """
+    format: str = 'jpg'
+    quality: int = 75
+    scale: float = 1.0
+
+    def params(self) -> List[int]:
+        if self.format == 'jpg':
+            return [cv.IMWRITE_JPEG_QUALITY, int(self.quality)]
+        if self.format == 'webp':
+            return [cv.IMWRITE_WEBP_QUALITY, int(self.quality)]
+        if self.format == 'png':
+            return [cv.IMWRITE_PNG_COMPRESSION, 1]
+        raise ValueError('unknown image format %r' % self.format)
+
+
+# (topic filter, settings), the first matching filter wins
+DEFAULT_ENCODINGS = [
+    # the visual calibration needs the details
+    ('calibration/image/#', EncodingSettings('jpg', 95, 1.0)),
+    # the rendered board of ProjectOnBoard
+    ('dartboard', EncodingSettings('png')),
+    # remote debug views
+    ('#', EncodingSettings('jpg', 75, 0.5)),
+]
+
+
+class ImageEncoder(object):
+    """
+    Thread-pool that encodes images for publishing, with encoding settings per topic.
+    Results are cached by the identity of the image (frame id, camera, producing module and output) and the settings,
+    so an image published to several topics with the same settings is encoded once. Encoding happens inside OpenCV, which releases the GIL.
+    """
+    def __init__(self, max_workers: int = 2, encodings: List[Tuple[str, EncodingSettings]] = None,
+                 cache_size: int = 32):
+        self.max_workers = max_workers
+        self.encodings = DEFAULT_ENCODINGS if encodings is None else encodings
+        self.cache_size = cache_size
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='ImageEncoder')
+        self._cache = OrderedDict()
+        self._cache_lock = Lock()
+        self._settings_cache = {}
+        self.hits = 0
+        self.misses = 0
+
+    def settings(self, topic: str) -> EncodingSettings:
+        settings = self._settings_cache.get(topic)
+        if settings is None:
+            settings = next((s for topic_filter, s in self.encodings if mqtt.topic_matches_sub(topic_filter, topic)),
+                            EncodingSettings())
+            self._settings_cache[topic] = settings
+        return settings
+
+    @staticmethod
+    def encode(image: np.ndarray, settings: EncodingSettings) -> bytes:
+        if settings.scale != 1.0:
+            image = cv.resize(image, None, fx=settings.scale, fy=settings.scale, interpolation=cv.INTER_AREA)
+        ok, encoded = cv.imencode('.' + settings.format, image, settings.params())
+        if not ok:
+            raise ValueError('could not encode image as %s' % settings.format)
+        return encoded.tobytes()
+
+    @staticmethod
+    def cache_key(image, source: str, settings: EncodingSettings) -> tuple:
+        # outputs of one module share frame id, camera and source, they are told apart by the topic they set on
+        # their camera_info (see CleanEdgeDetection)
+        return image.id, image.camera_info.get('name'), source, image.camera_info.get('topic'), settings
+
+    def submit(self, image, source: str, settings: EncodingSettings) -> Future:
+        """
+        :param image: a CVImage
+        :param source: name of the module that produced the image
+        :return: future of the encoded bytes
+        """
+        key = self.cache_key(image, source, settings)
+        with self._cache_lock:
+            future = self._cache.get(key)
+            if future is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return future
+            self.misses += 1
+            future = self._pool.submit(self.encode, image, settings)
+            self._cache[key] = future
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return future
+
+    def shutdown(self, wait: bool = True):
+        self._pool.shutdown(wait=wait)
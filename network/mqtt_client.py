@@ -7,6 +7,8 @@ import paho.mqtt.client as mqtt
 from core.helper import ModuleParameter
 from core.module import Module, Input, Output
 from core.datatypes import CVImage, MultiImage, JsonObject, BoardCoordinate
+from network.image_encoder import ImageEncoder, DEFAULT_ENCODINGS
+from network.mqtt_publisher import MQTTPublisher, DEFAULT_POLICIES
 
 
 class CalibrationMode(Enum):
@@ -30,13 +32,25 @@ class MQTTClient(Module):
         self.calibration_mode = ModuleParameter(CalibrationMode.NONE)
         self.mqtt_host = ModuleParameter("192.168.178.67")
         self.cam_ids = ModuleParameter(None, data_type=list)
+        # [(topic filter, PublishPolicy)], take precedence over network.mqtt_publisher.DEFAULT_POLICIES
+        self.publish_policies = ModuleParameter([], data_type=list)
+        self.max_queued_messages = ModuleParameter(32)
+        # [(topic filter, EncodingSettings)], take precedence over network.image_encoder.DEFAULT_ENCODINGS
+        self.image_encodings = ModuleParameter([], data_type=list)
+        self.encoding_workers = ModuleParameter(2)
 
         self.client = mqtt.Client()
+        self.publisher = None
+        self.encoder = None
         self.calibration_image_published = False
 
     def configure(self,
                   mqtt_host: str = None,
-                  calibration_mode: CalibrationMode = None):
+                  calibration_mode: CalibrationMode = None,
+                  publish_policies: list = None,
+                  max_queued_messages: int = None,
+                  image_encodings: list = None,
+                  encoding_workers: int = None):
         self._configure(locals())
 
     # The callback for when the client receives a CONNACK response from the server.
@@ -49,18 +63,23 @@ class MQTTClient(Module):
 
     def process_json_in(self, json: JsonObject):
         self.log_debug('publishing', json.get_dict(), 'on', json.topic)
-        self.client.publish(json.topic, json.get_string(), qos=2)
+        self.publisher.publish(json.topic, json.get_string())
 
     def process_coordinate_in(self, coord: BoardCoordinate):
         topic = 'board_coordinate'
         self.log_debug('publishing', coord.point, 'on', topic)
-        json_str = '{"x":%f, "y":%f}' % coord.point
-        self.client.publish(topic, json_str, qos=2)
+        if coord.segment is None:
+            json_str = '{"x":%f, "y":%f}' % coord.point
+        else:
+            json_str = '{"x":%f, "y":%f, "segment":%d, "multiplier":%d, "score":%d}' % (
+                coord.point + (coord.segment, coord.multiplier, coord.score))
+        # sent before any queued debug image
+        self.publisher.publish(topic, json_str)
 
     def process_image_in(self, image: CVImage):
         topic = image.camera_info['topic'] if 'topic' in image.camera_info else image.source.module_name
         self.log_debug('trying to publish on %s' % topic)
-        self.client.publish(topic, cv2.imencode('.png', image)[1].tostring(), qos=2)
+        self.publish_image(topic, image, image.source.module_name)
 
     def process_multi_image_in(self, multi_image: MultiImage):
         if self.calibration_mode == CalibrationMode.NONE:
@@ -68,21 +87,36 @@ class MQTTClient(Module):
                 cam_id = image.camera_info['name']
                 topic = image.camera_info['topic'] if 'topic' in image.camera_info else multi_image.source.module_name
                 self.log_debug('trying to publish on %s/%s' % (topic, cam_id))
-                self.client.publish("%s/%s" % (topic, cam_id), cv2.imencode('.jpg', image)[1].tostring(),
-                                    qos=2, retain=True)
+                self.publish_image("%s/%s" % (topic, cam_id), image, multi_image.source.module_name)
         else:
             if not self.calibration_image_published:
                 self.calibration_image_published = True
                 for image in multi_image.images:
                     self.log_debug('retaining image %s' % image.cam_id())
-                    self.client.publish("calibration/image/%s" % image.cam_id(),
-                                        cv2.imencode('.jpg', image)[1].tostring(),
-                                        retain=True, qos=2)
-                    self.client.publish("calibration/data/old_calibration/%s" % image.cam_id(),
-                                        json.dumps(image.camera_info['calibration']),
-                                        retain=True, qos=2)
+                    self.publish_image("calibration/image/%s" % image.cam_id(), image, multi_image.source.module_name)
+                    self.publisher.publish("calibration/data/old_calibration/%s" % image.cam_id(),
+                                           json.dumps(image.camera_info['calibration'].ratio_dict()))
+
+    def publish_image(self, topic: str, image: CVImage, source: str):
+        """
+        encodes the image in the background (with the settings of the topic) and publishes it once encoded
+        """
+        if not self.publisher.is_due(topic):
+            return
+
+        def publish(encoded):
+            if encoded.exception() is not None:
+                self.log_error('could not encode image for %s: %s' % (topic, encoded.exception()))
+            else:
+                self.publisher.publish(topic, encoded.result())
+
+        self.encoder.submit(image, source, self.encoder.settings(topic)).add_done_callback(publish)
 
     def __start__(self):
+        self.encoder = ImageEncoder(self.encoding_workers, list(self.image_encodings) + DEFAULT_ENCODINGS)
+        self.publisher = MQTTPublisher(self.client, list(self.publish_policies) + DEFAULT_POLICIES,
+                                       self.max_queued_messages)
+        self.publisher.start()
         self.client.on_connect = self.on_connect
         self.client.connect(self.mqtt_host, 1883, 60)
         if self.calibration_mode == CalibrationMode.HEADLESS_SERVER:
@@ -93,6 +127,10 @@ class MQTTClient(Module):
         self.client.loop_start()
 
     def __stop__(self):
+        if self.publisher is not None:
+            self.publisher.stop()
+        if self.encoder is not None:
+            self.encoder.shutdown(wait=False)
         self.client.loop_stop()
         self.client.disconnect()
 
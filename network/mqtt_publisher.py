@@ -0,0 +1,206 @@
+import heapq
+import itertools
+import logging
+import time
+from threading import Condition, Thread
+from typing import Dict, List, NamedTuple, Optional, Tuple, Union
+
+import paho.mqtt.client as mqtt
+
+from core.helper import Loggable
+
+PRIORITY_COORDINATE = 0
+PRIORITY_DATA = 1
+PRIORITY_IMAGE = 2
+
+
+class PublishPolicy(NamedTuple):
+    """
+    :param max_rate: maximum number of messages per second, messages above the rate are dropped
+    :param latest_only: a queued message that was not sent yet is replaced by newer messages on the same topic
+    :param priority: lower values are sent first
+    """
+    qos: int = 0
+    retain: bool = False
+    max_rate: Optional[float] = None
+    latest_only: bool = False
+    priority: int = PRIORITY_DATA
+
+
+# (topic filter, policy), the first matching filter wins
+DEFAULT_POLICIES = [
+    ('board_coordinate', PublishPolicy(qos=2, priority=PRIORITY_COORDINATE)),
+    ('calibration/image/#', PublishPolicy(qos=1, retain=True, latest_only=True, priority=PRIORITY_IMAGE)),
+    ('calibration/data/old_calibration/#', PublishPolicy(qos=2, retain=True)),
+    # new calibrations are applied once, a retained one would be re-applied on every reconnect of the server
+    ('calibration/#', PublishPolicy(qos=2)),
+    ('frame_rate', PublishPolicy(qos=0, latest_only=True)),
+    # the rendered board of ProjectOnBoard, one per dart
+    ('dartboard', PublishPolicy(qos=0, retain=True, latest_only=True, priority=PRIORITY_IMAGE)),
+    # everything else are remote debug images
+    ('#', PublishPolicy(qos=0, retain=True, max_rate=5.0, latest_only=True, priority=PRIORITY_IMAGE)),
+]
+
+
+class MQTTPublisher(object):
+    """
+    Bounded outgoing queue of an MQTT client, drained by a dedicated sender thread in order of priority.
+    Publishing never blocks the calling module. The sender waits until each message has been handed to the
+    network before sending the next one, so a coordinate never queues behind more than one (image) payload.
+    When the queue is full, the oldest message of the lowest priority is dropped, never one of higher priority
+    than the new message.
+    """
+    def __init__(self, client: mqtt.Client, policies: List[Tuple[str, PublishPolicy]] = None,
+                 max_queued: int = 32, send_timeout: float = 2.0):
+        self.client = client
+        self.policies = DEFAULT_POLICIES if policies is None else policies
+        self.max_queued = max_queued
+        self.send_timeout = send_timeout
+
+        self._queue = []  # heap of [priority, sequence, topic, payload, policy], payload None if dropped
+        self._queued_topics = {}  # topic -> queue entry, for latest_only topics
+        self._queued = 0
+        self._sequence = itertools.count()
+        self._last_published = {}  # topic -> time, for rate limited topics
+        self._policy_cache = {}
+        self._condition = Condition()
+        self._running = False
+        self._sender = None
+
+        self.sent = 0
+        # handed to the client, but not published within send_timeout
+        self.timed_out = 0
+        self.coalesced = 0
+        self.dropped = 0
+
+    def policy(self, topic: str) -> PublishPolicy:
+        policy = self._policy_cache.get(topic)
+        if policy is None:
+            policy = next((p for topic_filter, p in self.policies if mqtt.topic_matches_sub(topic_filter, topic)),
+                          PublishPolicy())
+            self._policy_cache[topic] = policy
+        return policy
+
+    def start(self):
+        with self._condition:
+            if self._running:
+                return
+            self._running = True
+        self._sender = Thread(target=self.send_loop, name='MQTTPublisher-sender', daemon=True)
+        self._sender.start()
+
+    def stop(self, timeout: float = 2.0):
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        if self._sender is not None:
+            self._sender.join(timeout)
+
+    def is_due(self, topic: str) -> bool:
+        """
+        :return: whether a message on the topic would be sent, lets expensive payloads be skipped early
+        """
+        policy = self.policy(topic)
+        if policy.max_rate is None or topic in self._queued_topics:
+            return True
+        return time.time() - self._last_published.get(topic, 0) >= 1. / policy.max_rate
+
+    def publish(self, topic: str, payload: Union[str, bytes], policy: PublishPolicy = None) -> bool:
+        """
+        queues a message, policy defaults to the one configured for the topic
+        :return: whether the message was queued
+        """
+        policy = self.policy(topic) if policy is None else policy
+        now = time.time()
+        with self._condition:
+            if policy.latest_only:
+                entry = self._queued_topics.get(topic)
+                if entry is not None:
+                    entry[3] = payload
+                    entry[4] = policy
+                    self.coalesced += 1
+                    return True
+
+            if policy.max_rate is not None:
+                if now - self._last_published.get(topic, 0) < 1. / policy.max_rate:
+                    self.dropped += 1
+                    return False
+                self._last_published[topic] = now
+
+            if self._queued >= self.max_queued and not self._drop_lowest(policy.priority):
+                self.dropped += 1
+                return False
+
+            entry = [policy.priority, next(self._sequence), topic, payload, policy]
+            heapq.heappush(self._queue, entry)
+            self._queued += 1
+            if policy.latest_only:
+                self._queued_topics[topic] = entry
+            self._condition.notify()
+        return True
+
+    def _drop_lowest(self, priority: int) -> bool:
+        """
+        drops the oldest queued message of the lowest priority, if that is lower than the given one
+        """
+        candidates = [entry for entry in self._queue if entry[3] is not None and entry[0] > priority]
+        if not candidates:
+            return False
+        lowest = max(entry[0] for entry in candidates)
+        victim = min((entry for entry in candidates if entry[0] == lowest), key=lambda entry: entry[1])
+        # the entry stays in the heap and is skipped by the sender
+        victim[3] = None
+        self._forget(victim)
+        self.dropped += 1
+        return True
+
+    def _forget(self, entry):
+        self._queued -= 1
+        if self._queued_topics.get(entry[2]) is entry:
+            del self._queued_topics[entry[2]]
+
+    def _next(self):
+        with self._condition:
+            while self._running:
+                while self._queue and self._queue[0][3] is None:
+                    heapq.heappop(self._queue)
+                if self._queue:
+                    entry = heapq.heappop(self._queue)
+                    self._forget(entry)
+                    return entry
+                self._condition.wait()
+            return None
+
+    def send_loop(self):
+        while True:
+            entry = self._next()
+            if entry is None:
+                return
+            _, _, topic, payload, policy = entry
+            try:
+                info = self.client.publish(topic, payload, qos=policy.qos, retain=policy.retain)
+                self._wait_for_publish(info)
+            except Exception as e:
+                # e.g. not connected or the client's own queue is full, the message is dropped
+                self.dropped += 1
+                Loggable._log('could not publish on %s:' % topic, repr(e), level=logging.WARN,
+                              module_name='MQTTPublisher')
+                continue
+            if info.is_published():
+                self.sent += 1
+            else:
+                self.timed_out += 1
+
+    def _wait_for_publish(self, info: mqtt.MQTTMessageInfo):
+        try:
+            info.wait_for_publish(self.send_timeout)
+        except TypeError:
+            # paho < 1.6 can only wait without timeout
+            deadline = time.time() + self.send_timeout
+            while not info.is_published() and time.time() < deadline:
+                time.sleep(0.001)
+
+    def metrics(self) -> Dict[str, int]:
+        with self._condition:
+            return {'queued': self._queued, 'sent': self.sent, 'timed_out': self.timed_out,
+                    'coalesced': self.coalesced, 'dropped': self.dropped}
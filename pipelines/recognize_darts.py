@@ -6,8 +6,7 @@ from network.camera_grabber import CameraGrabber
 from network.mqtt_client import MQTTClient
 from processing.background_subtraction import BackgroundSubtraction
 from processing.metadatawriter import MetaDataWriter
-from processing.clean_difference import CleanDifference
-from processing.edge_detection import EdgeDetection
+from processing.clean_edge_detection import CleanEdgeDetection
 from processing.fit_line import FitLine
 from processing.project_on_board import ProjectOnBoard
 
@@ -20,8 +19,7 @@ class RecognizeDarts(Pipeline):
         self.network_client = MQTTClient()
         self.calibrator = MetaDataWriter()
         self.bg_sub = BackgroundSubtraction()
-        self.clean_diff = CleanDifference()
-        self.edge_det = EdgeDetection()
+        self.clean_edge_det = CleanEdgeDetection()
         self.fit_line = FitLine()
         self.board_projection = ProjectOnBoard()
 
@@ -30,13 +28,11 @@ class RecognizeDarts(Pipeline):
         self.grabber.images_out.connect(self.calibrator.raw_images_in)
         # Next we need to do background-subtraction (event-detection also happens here)
         self.calibrator.calibrated_images_out.connect(self.bg_sub.images_in)
-        # If we have an event -> clean that up a bit
-        self.bg_sub.synced_foregrounds_out.connect(self.clean_diff.foregrounds_in)
-        # Detect edges
-        self.clean_diff.diff_out.connect(self.edge_det.diff_in)
-        # Fit a line, get a 2D impact point (we need the raw images only to paint that line for debugging purposes)
-        self.edge_det.contours_out.connect(self.fit_line.contour_collection_in)
-        self.calibrator.calibrated_images_out.connect(self.fit_line.raw_images_in)
+        # If we have an event -> clean that up a bit and detect edges (in one go)
+        self.bg_sub.synced_foregrounds_out.connect(self.clean_edge_det.foregrounds_in)
+        # Fit a line, get a 2D impact point (the raw images to paint that line for debugging purposes come from the
+        # FrameStore)
+        self.clean_edge_det.contours_out.connect(self.fit_line.contour_collection_in)
         # Project the 2D points onto the board
         self.fit_line.impact_points_out.connect(self.board_projection.impact_points_in)
         # Send coordinate to whoever wants it (the scoring app for instance)
@@ -45,13 +41,14 @@ class RecognizeDarts(Pipeline):
         # ALL THESE CONNECTIONS ARE OPTIONAL AND JUST FOR REMOTE DEBUG INFORMATION
         self.grabber.frame_rate_out.connect(self.network_client.json_in)
         self.bg_sub.synced_foregrounds_out.connect(self.network_client.multi_image_in)
-        self.clean_diff.diff_out.connect(self.network_client.multi_image_in)
+        self.clean_edge_det.diff_out.connect(self.network_client.multi_image_in)
         self.board_projection.dartboard_out.connect(self.network_client.image_in)
-        self.edge_det.edged_out.connect(self.network_client.multi_image_in)
+        self.clean_edge_det.edged_out.connect(self.network_client.multi_image_in)
         self.fit_line.debug_images_out.connect(self.network_client.multi_image_in)
 
     def configure(self):
         self.grabber.configure(cam_ids=[0, 1])
+        self.calibrator.configure(grayscale_processing=True)
         self.bg_sub.configure(enable_debug_images=False)
         self.network_client.configure(mqtt_host='localhost')
 
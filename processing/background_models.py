@@ -0,0 +1,98 @@
+from typing import Callable, Dict
+
+import numpy as np
+import cv2 as cv
+
+
+class BackgroundModel(object):
+    """
+    Common interface of all background-model engines. It mirrors OpenCV's BackgroundSubtractor, so the
+    OpenCV implementations can be registered directly: apply() returns a binary (0/255) foreground mask,
+    learningRate=0 leaves the model untouched, 1 replaces it and -1 uses the engine's default rate.
+    """
+    default_learning_rate = 0.05
+
+    def __init__(self, threshold: int = 25):
+        self.threshold = threshold
+
+    def apply(self, image: np.ndarray, learningRate: float = -1) -> np.ndarray:
+        raise NotImplementedError("Please implement this method in subclass")
+
+    def getBackgroundImage(self) -> np.ndarray:
+        raise NotImplementedError("Please implement this method in subclass")
+
+    def _foreground(self, image: np.ndarray, background: np.ndarray) -> np.ndarray:
+        diff = cv.absdiff(image, background)
+        if diff.ndim == 3:
+            diff = diff.max(axis=2)
+        return cv.threshold(diff, self.threshold, 255, cv.THRESH_BINARY)[1]
+
+    def _rate(self, learning_rate: float) -> float:
+        return self.default_learning_rate if learning_rate < 0 else min(learning_rate, 1.0)
+
+
+class RunningAverage(BackgroundModel):
+    """
+    Exponential running average in 12.4 fixed-point integers, cheaper than any mixture-model
+    """
+    SHIFT = 4
+
+    def __init__(self, threshold: int = 25):
+        super().__init__(threshold)
+        self.background = None
+
+    def apply(self, image: np.ndarray, learningRate: float = -1) -> np.ndarray:
+        if self.background is None:
+            self.background = image.astype(np.int32) << self.SHIFT
+            return np.zeros(image.shape[:2], np.uint8)
+        fg = self._foreground(image, self.getBackgroundImage())
+        rate = int(round(self._rate(learningRate) * 256))
+        if rate:
+            self.background += (((image.astype(np.int32) << self.SHIFT) - self.background) * rate) >> 8
+        return fg
+
+    def getBackgroundImage(self) -> np.ndarray:
+        return (self.background >> self.SHIFT).astype(np.uint8)
+
+
+class ReferenceFrame(BackgroundModel):
+    """
+    Plain absolute difference against a reference frame, that is only blended while learning
+    """
+    def __init__(self, threshold: int = 25):
+        super().__init__(threshold)
+        self.reference = None
+
+    def apply(self, image: np.ndarray, learningRate: float = -1) -> np.ndarray:
+        if self.reference is None:
+            self.reference = image.copy()
+            return np.zeros(image.shape[:2], np.uint8)
+        fg = self._foreground(image, self.reference)
+        rate = self._rate(learningRate)
+        if rate >= 1.0:
+            self.reference = image.copy()
+        elif rate > 0:
+            self.reference = cv.addWeighted(self.reference, 1.0 - rate, image, rate, 0)
+        return fg
+
+    def getBackgroundImage(self) -> np.ndarray:
+        return self.reference
+
+
+BACKGROUND_MODELS = {
+    'mog2': lambda: cv.createBackgroundSubtractorMOG2(detectShadows=False),
+    'knn': lambda: cv.createBackgroundSubtractorKNN(detectShadows=False),
+    'running_average': RunningAverage,
+    'reference': ReferenceFrame,
+}  # type: Dict[str, Callable[[], BackgroundModel]]
+
+
+def register_background_model(name: str, factory: Callable[[], BackgroundModel]):
+    BACKGROUND_MODELS[name] = factory
+
+
+def create_background_model(name: str):
+    try:
+        return BACKGROUND_MODELS[name]()
+    except KeyError:
+        raise KeyError('unknown background model %r, choose one of %s' % (name, ', '.join(BACKGROUND_MODELS)))
@@ -1,6 +1,7 @@
+import os
 import time
 from copy import deepcopy
-from threading import Lock
+from threading import Lock, Thread
 
 import numpy as np
 
@@ -8,14 +9,14 @@ from termcolor import colored
 
 from core.helper import ModuleParameter
 from core.module import Module, Input, Output
+from core.parallel import CameraExecutor
 from core.datatypes import CVImage, SetBackgroundTrigger, MultiImage
+from core.frame_buffer import FrameRingBuffer
+from processing.background_models import create_background_model
 import cv2 as cv
 
 
 class BackgroundSubtraction(Module):
-
-    create_new = cv.createBackgroundSubtractorMOG2
-
     def __init__(self):
         super().__init__()
         self.images_in = Input(data_type=MultiImage, config_keys=['cam_ids'], num_worker_threads=1)
@@ -38,13 +39,54 @@ class BackgroundSubtraction(Module):
         self.thresh_high = 20000
         self.thresh_too_high = 150000
 
+        self.latest_streams = {}
+        self.previous_scaled = {}
+        self.settling = None
+        self.background_trigger_pending = False
+        self.event_frames = FrameRingBuffer(max_frames=30)
+        self.restored_backgrounds = {}
+        self.latest_snapshot = time.time()
+
+        self.gate_references = {}
+        self.gate_counters = {'gated': 0, 'passed': 0}
+
         self.cam_ids = ModuleParameter(None, data_type=list)
         self.enable_debug_images = ModuleParameter(False)
         self.min_amount_of_initial_images = ModuleParameter(5)
+        # engines from processing.background_models for the full-res roi- and the downscaled EVENT_-streams
+        self.background_model = ModuleParameter('mog2')
+        self.event_background_model = ModuleParameter('mog2')
+        # frames whose block-mean thumbnails did not change beyond the noise floor skip the event-detection
+        self.motion_gate = ModuleParameter(True)
+        self.motion_gate_noise_floor = ModuleParameter(4)
+        self.motion_gate_grid = ModuleParameter((64, 8))
+        # learned backgrounds are saved periodically and restored after a restart if the board still looks the same
+        self.snapshot_directory = ModuleParameter('BACKGROUND')
+        self.snapshot_interval = ModuleParameter(60.0)
+        self.snapshot_tolerance = ModuleParameter(0.01)
+        # only the (margin-padded) bounding box of the low-res event blobs is passed downstream
+        self.enable_dynamic_roi = ModuleParameter(True)
+        self.dynamic_roi_margin = ModuleParameter(40)
+        self.min_event_blob_area = ModuleParameter(4)
+        # after an event, the first frame with at most settle_threshold moving (low-res) pixels is processed,
+        # or the calmest one after max_settle_frames
+        self.settle_threshold = ModuleParameter(10)
+        self.settle_pixel_threshold = ModuleParameter(25)
+        self.max_settle_frames = ModuleParameter(6)
 
     def configure(self,
                   enable_debug_images: bool = None,
-                  min_amount_of_initial_images: int = None):
+                  min_amount_of_initial_images: int = None,
+                  background_model: str = None,
+                  event_background_model: str = None,
+                  motion_gate: bool = None,
+                  motion_gate_noise_floor: int = None,
+                  snapshot_directory: str = None,
+                  snapshot_interval: float = None,
+                  enable_dynamic_roi: bool = None,
+                  dynamic_roi_margin: int = None,
+                  settle_threshold: int = None,
+                  max_settle_frames: int = None):
         self._configure(locals())
 
     def re_init_subtractors(self):
@@ -54,10 +96,23 @@ class BackgroundSubtraction(Module):
         for c in self.cam_ids:
             cam_ids.append('EVENT_%s' % c)
 
-        subs = {c: BackgroundSubtraction.create_new(detectShadows=False) for c in cam_ids}
+        subs = {c: create_background_model(self.background_model if c in self.cam_ids else self.event_background_model)
+                for c in cam_ids}
         self.initial_images = {c: 0 for c in cam_ids}
         return subs
 
+    def fork_subtractors(self, seed_images):
+        """
+        creates new subtractors that are seeded with the latest frame (including the new dart) in a single step,
+        instead of re-learning them from the following frames
+        """
+        subs = self.re_init_subtractors()
+        for stream, image in seed_images.items():
+            subs[stream].apply(image, learningRate=1)
+            self.initial_images[stream] = self.min_amount_of_initial_images
+        self.log_debug('forked background subtractors for', list(seed_images.keys()))
+        return subs
+
     def get_bg_sub(self):
         with self.sub_lock:
             if self.temp_subtraction_active:
@@ -79,8 +134,9 @@ class BackgroundSubtraction(Module):
             if trigger.dart_number == 0:
                 self.temp_subtraction_active = False
             else:
-                self.temp_subtractor = self.re_init_subtractors()
+                self.temp_subtractor = self.fork_subtractors(dict(self.latest_streams))
                 self.temp_subtraction_active = True
+            self.background_trigger_pending = False
 
     def add_background(self, background):
         self.log_debug('add bg for', background.camera_info['name'], background.shape)
@@ -89,65 +145,121 @@ class BackgroundSubtraction(Module):
         self.get_bg_sub()[background.camera_info['name']].apply(background, learningRate=0.5)
         Module.show_image("BG %s" % background.cam_id(), background)
 
+    def restore_background(self, image: CVImage):
+        snapshot = self.restored_backgrounds.pop(image.cam_id(), None)
+        if snapshot is None:
+            return False
+        if snapshot.shape != image.shape:
+            self.log_warn('discarding background snapshot of', image.cam_id(), 'with shape', snapshot.shape)
+            return False
+        changed = np.count_nonzero(cv.absdiff(snapshot, image) > 25) / float(snapshot.size)
+        if changed > self.snapshot_tolerance:
+            self.log_warn('discarding background snapshot of', image.cam_id(),
+                          '%.1f%% of the live frame changed' % (changed * 100))
+            return False
+        self.log_debug('restored background snapshot of', image.cam_id())
+        self.get_bg_sub()[image.cam_id()].apply(snapshot, learningRate=1)
+        self.initial_images[image.cam_id()] = self.min_amount_of_initial_images
+        return True
+
+    def snapshot_backgrounds(self, blocking=True):
+        self.latest_snapshot = time.time()
+        with self.sub_lock:
+            subtractors = self.background_subtractor
+            # while darts are on the board the temporary fork is trained and initial_images counts its images,
+            # the main subtractor keeps the empty board it was forked from
+            trained = self.temp_subtraction_active or \
+                self.initial_images is not None and \
+                min(self.initial_images.values()) >= self.min_amount_of_initial_images
+        if subtractors is None or not trained:
+            return
+        backgrounds = {stream: sub.getBackgroundImage() for stream, sub in subtractors.items()}
+        if blocking:
+            self.save_backgrounds(backgrounds)
+        else:
+            saving_thread = Thread(target=self.save_backgrounds, args=[backgrounds])
+            saving_thread.setDaemon(True)
+            saving_thread.start()
+
+    def save_backgrounds(self, backgrounds):
+        os.makedirs(self.snapshot_directory, exist_ok=True)
+        for stream, background in backgrounds.items():
+            # write and rename, so an interrupted write never leaves a broken snapshot behind
+            tmp_path = os.path.join(self.snapshot_directory, '.%s.tmp.png' % stream)
+            cv.imwrite(tmp_path, background)
+            os.replace(tmp_path, os.path.join(self.snapshot_directory, '%s.png' % stream))
+        self.log_debug('saved background snapshots of', list(backgrounds.keys()))
+
+    def load_backgrounds(self):
+        self.restored_backgrounds = {}
+        for stream in self.cam_ids + ['EVENT_%s' % c for c in self.cam_ids]:
+            path = os.path.join(self.snapshot_directory, '%s.png' % stream)
+            if os.path.exists(path):
+                self.restored_backgrounds[stream] = cv.imread(path, cv.IMREAD_UNCHANGED)
+        self.log_debug('found background snapshots of', list(self.restored_backgrounds.keys()))
+
+    def __custom_pre_start__(self):
+        self.load_backgrounds()
+
+    def __stop__(self):
+        self.snapshot_backgrounds()
+
     def process_rois_in(self, rois: MultiImage):
-        foregrounds = []
-        for image in rois.images:
-            roi = image.camera_info['suggested_roi']
-            self.log_debug('getting bg-sub for cam', image.cam_id(), 'with',
-                           self.initial_images[image.cam_id()], 'initial images')
-            foreground = CVImage(self.get_bg_sub()[image.cam_id()].apply(image, learningRate=0),
-                                 image.id, image.camera_info)
-
-            foreground.camera_info['roi'] = roi
-            foreground.camera_info.pop('suggested_roi')
-            foregrounds.append(foreground)
+        foregrounds = CameraExecutor.shared().map(self.subtract_roi, rois.images)
         with self.sub_lock:
             self.synced_sub_in_progress = False
         self.synced_foregrounds_out.data_ready(MultiImage(foregrounds))
 
-    def process_images_in(self, images: MultiImage):
-        diffs = []
-        image_collection = {}
+    def subtract_roi(self, image: CVImage):
+        roi = image.camera_info['suggested_roi']
+        dynamic_roi = image.camera_info.pop('dynamic_roi', roi)
+        self.log_debug('getting bg-sub for cam', image.cam_id(), 'with',
+                       self.initial_images[image.cam_id()], 'initial images')
+        foreground = self.get_bg_sub()[image.cam_id()].apply(image, learningRate=0)
+        x, y = dynamic_roi[0] - roi[0], dynamic_roi[1] - roi[1]
+        foreground = CVImage(foreground[y:y + dynamic_roi[3], x:x + dynamic_roi[2]], image.id, image.camera_info)
+
+        foreground.camera_info['roi'] = dynamic_roi
+        foreground.camera_info.pop('suggested_roi')
+        return foreground
+
+    def get_dynamic_roi(self, collection):
+        """
+        maps the bounding boxes of the event blobs to full resolution
+        :return: the padded union of all boxes in full-frame coordinates
+        """
+        roi = [int(v) for v in collection['roi'].camera_info['suggested_roi']]
+        scale = roi[2] / float(collection['event_mask'].shape[1])
+        _, _, stats, _ = cv.connectedComponentsWithStats(collection['event_mask'])
+        # component 0 is the background
+        boxes = [[int(roi[0] + x * scale), int(roi[1] + y * scale), int(w * scale), int(h * scale)]
+                 for x, y, w, h, area in stats[1:] if area >= self.min_event_blob_area]
+        collection['roi'].camera_info['event_boxes'] = boxes
+        if not self.enable_dynamic_roi or not boxes:
+            return roi
+
+        x0 = max(min(b[0] for b in boxes) - self.dynamic_roi_margin, roi[0])
+        y0 = max(min(b[1] for b in boxes) - self.dynamic_roi_margin, roi[1])
+        x1 = min(max(b[0] + b[2] for b in boxes) + self.dynamic_roi_margin, roi[0] + roi[2])
+        y1 = min(max(b[1] + b[3] for b in boxes) + self.dynamic_roi_margin, roi[1] + roi[3])
+        return [x0, y0, x1 - x0, y1 - y0]
 
+    def process_images_in(self, images: MultiImage):
         if self.initial_images is None:
             self.log_debug('initial images none')
             self.get_bg_sub()
 
-        do_return = False
+        if time.time() - self.latest_snapshot > self.snapshot_interval:
+            self.snapshot_backgrounds(blocking=False)
 
-        for image in images.images:
-            cam_id = image.cam_id()
-            image_collection[image.cam_id()] = {}
-            roi = image.camera_info['suggested_roi']
-            roi_image = image[int(roi[1]):int(roi[1] + roi[3]), int(roi[0]):int(roi[0] + roi[2])]
-            image_collection[image.cam_id()]['roi'] = roi_image
-            scaled_image = cv.resize(roi_image, dsize=(int(roi[2] / 4), int(roi[3] / 4)),
-                                     interpolation=cv.INTER_NEAREST)
-
-            scaled_image = CVImage(scaled_image, image.id, deepcopy(image.camera_info))
-            scaled_image.camera_info['name'] = 'EVENT_%s' % cam_id
-            image_collection[image.cam_id()]['scaled'] = scaled_image
-
-            if self.initial_images[scaled_image.cam_id()] < self.min_amount_of_initial_images:
-                self.add_background(scaled_image)
-                self.add_background(CVImage(roi_image, image.id, image.camera_info))
-                do_return = True
-                continue
-
-            # start event-detection
-            small = CVImage(self.get_bg_sub()[scaled_image.cam_id()].apply(scaled_image, learningRate=0),
-                                 image.id, image.camera_info)
-            small_fg = cv.bilateralFilter(small, 5, 57, 57)
-
-            kernel = np.ones((2, 2), np.uint8)
-            small_fg = cv.morphologyEx(small_fg, cv.MORPH_OPEN, kernel)
-            small_fg = cv.morphologyEx(small_fg, cv.MORPH_CLOSE, kernel)
-            small_fg = cv.threshold(small_fg, 5, 255, cv.THRESH_BINARY)[1]
-
-            diff = np.sum(small_fg)
-            diffs.append(diff)
-
-        if do_return:
+        if self.is_static(images):
+            return
+
+        results = CameraExecutor.shared().map(self.detect_event, images.images)
+        image_collection = {cam_id: collection for cam_id, collection, _ in results}
+        diffs = [diff for _, _, diff in results]
+
+        if None in diffs:
             return
 
         max_diff = max(diffs)
@@ -161,16 +273,126 @@ class BackgroundSubtraction(Module):
                 self.add_background(collection['scaled'])
                 self.add_background(collection['roi'])
 
+        if self.settling is not None:
+            if max_diff > self.thresh_high:
+                self.settle(image_collection)
+            else:
+                self.log_debug('event vanished while settling, ignoring it')
+                self.settling = None
+                self.event_frames.clear()
+            return
+
         # this probably won't work nicely until we have 3 cameras
         if max_diff > self.thresh_high and min_diff > (self.thresh_low * 2):
             self.log_debug(colored('OVER THRESHOLD! %r' % diffs, 'cyan'))
             if min(self.initial_images.values()) < self.min_amount_of_initial_images:
                 self.log_debug('too few images..... ignoring')
                 return
-            with self.sub_lock:
-                self.synced_sub_in_progress = True
-            self.set_background_trigger_in.add_to_data_queue(SetBackgroundTrigger(1), self)
-            self.rois_in.add_to_data_queue(MultiImage([c['roi'] for c in image_collection.values()]), self)
-
-
+            if self.background_trigger_pending:
+                self.log_debug('background not forked yet..... ignoring')
+                return
+            self.settling = {'trigger_id': images.images[0].id, 'frames': 0}
+            self.settle(image_collection)
+
+    def settle(self, image_collection):
+        """
+        buffers the frames following an event until the dart came to rest, then processes the best of them
+        """
+        for collection in image_collection.values():
+            collection['roi'].camera_info['dynamic_roi'] = self.get_dynamic_roi(collection)
+            collection['roi'].camera_info['event_motion'] = collection['motion']
+        # the rois are views into the full frames, copies only keep the rois alive
+        self.event_frames.append(MultiImage([c['roi'].copy() for c in image_collection.values()]))
+        self.settling['frames'] += 1
+
+        def motion(multi_image):
+            return max(image.camera_info['event_motion'] for image in multi_image.images)
+
+        if motion(self.event_frames.latest()) <= self.settle_threshold:
+            best = self.event_frames.latest()
+        elif self.settling['frames'] >= self.max_settle_frames:
+            best = min(self.event_frames.since(self.settling['trigger_id']), key=motion)
+        else:
+            return
+        self.log_debug(colored('settled after %d frames, motion %d' % (self.settling['frames'], motion(best)),
+                               'cyan'))
+        self.settling = None
+        self.event_frames.clear()
 
+        with self.sub_lock:
+            self.synced_sub_in_progress = True
+            self.background_trigger_pending = True
+        self.set_background_trigger_in.add_to_data_queue(SetBackgroundTrigger(1), self)
+        self.rois_in.add_to_data_queue(best, self)
+
+    def is_static(self, images: MultiImage):
+        # never gate while a model is still learning its initial images or an event is settling
+        if not self.motion_gate or self.settling is not None \
+                or min(self.initial_images.values()) < self.min_amount_of_initial_images:
+            return False
+
+        thumbnails = {}
+        static = True
+        for image in images.images:
+            roi = image.camera_info['suggested_roi']
+            roi_image = image[int(roi[1]):int(roi[1] + roi[3]), int(roi[0]):int(roi[0] + roi[2])]
+            thumbnails[image.cam_id()] = cv.resize(roi_image, dsize=tuple(self.motion_gate_grid),
+                                                   interpolation=cv.INTER_AREA)
+            reference = self.gate_references.get(image.cam_id())
+            if reference is None or np.max(cv.absdiff(thumbnails[image.cam_id()], reference)) \
+                    > self.motion_gate_noise_floor:
+                static = False
+
+        if static:
+            self.gate_counters['gated'] += 1
+        else:
+            # only frames that pass the gate become the new reference, so slow drifts pass eventually
+            self.gate_references = thumbnails
+            self.gate_counters['passed'] += 1
+        if sum(self.gate_counters.values()) % 300 == 0:
+            self.log_debug('motion gate skipped %d of %d frames' % (self.gate_counters['gated'],
+                                                                    sum(self.gate_counters.values())))
+        return static
+
+    def detect_event(self, image: CVImage):
+        cam_id = image.cam_id()
+        collection = {}
+        roi = image.camera_info['suggested_roi']
+        roi_image = image[int(roi[1]):int(roi[1] + roi[3]), int(roi[0]):int(roi[0] + roi[2])]
+        collection['roi'] = roi_image
+        scaled_image = cv.resize(roi_image, dsize=(int(roi[2] / 4), int(roi[3] / 4)),
+                                 interpolation=cv.INTER_NEAREST)
+
+        scaled_image = CVImage(scaled_image, image.id, deepcopy(image.camera_info))
+        scaled_image.camera_info['name'] = 'EVENT_%s' % cam_id
+        collection['scaled'] = scaled_image
+
+        streams = [scaled_image, CVImage(roi_image, image.id, image.camera_info)]
+        if min(self.initial_images[stream.cam_id()] for stream in streams) < self.min_amount_of_initial_images:
+            for stream in streams:
+                if self.initial_images[stream.cam_id()] < self.min_amount_of_initial_images \
+                        and not self.restore_background(stream):
+                    self.add_background(stream)
+            return cam_id, collection, None
+
+        for stream in streams:
+            self.latest_streams[stream.cam_id()] = stream
+
+        previous = self.previous_scaled.get(cam_id)
+        self.previous_scaled[cam_id] = scaled_image
+        collection['motion'] = np.count_nonzero(cv.absdiff(scaled_image, previous) > self.settle_pixel_threshold) \
+            if previous is not None and previous.shape == scaled_image.shape else 0
+
+        # start event-detection
+        small_fg = self.clean_event_mask(self.get_bg_sub()[scaled_image.cam_id()].apply(scaled_image, learningRate=0))
+        collection['event_mask'] = small_fg
+        return cam_id, collection, np.sum(small_fg)
+
+    @staticmethod
+    def clean_event_mask(small):
+        small_fg = cv.bilateralFilter(small, 5, 57, 57)
+
+        kernel = np.ones((2, 2), np.uint8)
+        small_fg = cv.morphologyEx(small_fg, cv.MORPH_OPEN, kernel)
+        small_fg = cv.morphologyEx(small_fg, cv.MORPH_CLOSE, kernel)
+        return cv.threshold(small_fg, 5, 255, cv.THRESH_BINARY)[1]
@@ -1,4 +1,5 @@
-from typing import List
+from functools import lru_cache
+from typing import Callable, Dict, List, Tuple
 
 import numpy as np
 
@@ -6,40 +7,124 @@ from core.helper import ModuleParameter, create_trackbar
 from core.module import Module, Input, Output
 from core.datatypes import CVImage, MultiImage
 from core.convenience import resize
+from core.parallel import CameraExecutor
 import cv2 as cv
 
 
+def _bilateral(image: np.ndarray, diameter: int) -> np.ndarray:
+    return cv.bilateralFilter(image, diameter, 57, 57)
+
+
+def _median(image: np.ndarray, size: int) -> np.ndarray:
+    return cv.medianBlur(image, size)
+
+
+def _box(image: np.ndarray, size: int) -> np.ndarray:
+    return cv.blur(image, (size, size), dst=image)
+
+
+def _morphology(operations):
+    """
+    rectangular structuring elements are separable: one row- and one column-pass instead of a full size x size one
+    """
+    def step(image: np.ndarray, size: int) -> np.ndarray:
+        row, column = np.ones((1, size), np.uint8), np.ones((size, 1), np.uint8)
+        for operation in operations:
+            operation(image, row, dst=image)
+            operation(image, column, dst=image)
+        return image
+    return step
+
+
+def _threshold(image: np.ndarray, value: int) -> np.ndarray:
+    cv.threshold(image, value, 255, cv.THRESH_BINARY, dst=image)
+    return image
+
+
+def _area(image: np.ndarray, min_area: int) -> np.ndarray:
+    """
+    removes all connected components smaller than min_area pixels
+    """
+    count, labels, stats, _ = cv.connectedComponentsWithStats(image, connectivity=8)
+    keep = stats[:, cv.CC_STAT_AREA] >= min_area
+    keep[0] = True  # background
+    image[~keep[labels]] = 0
+    return image
+
+
+DENOISE_STEPS = {
+    'bilateral': _bilateral,
+    'median': _median,
+    'box': _box,
+    'open': _morphology([cv.erode, cv.dilate]),
+    'close': _morphology([cv.dilate, cv.erode]),
+    'threshold': _threshold,
+    'area': _area,
+}  # type: Dict[str, Callable[[np.ndarray, int], np.ndarray]]
+
+# the chain the pipeline always used
+DEFAULT_DENOISE_CHAIN = ['bilateral:11', 'open:3', 'close:3', 'threshold:5']
+
+
+@lru_cache(maxsize=32)
+def build_denoise_chain(steps: Tuple[str, ...]) -> Callable[[np.ndarray], np.ndarray]:
+    """
+    :param steps: 'name:parameter' entries of DENOISE_STEPS, applied in the given order
+    :return: a function that denoises an image, possibly in-place
+    """
+    chain = []
+    for step in steps:
+        name, _, parameter = step.partition(':')
+        if name not in DENOISE_STEPS:
+            raise ValueError('unknown denoise step %r, choose one of %s' % (name, ', '.join(DENOISE_STEPS)))
+        try:
+            chain.append((DENOISE_STEPS[name], int(parameter)))
+        except ValueError:
+            raise ValueError('denoise step %r needs an integer parameter, e.g. %s:3' % (step, name))
+
+    def denoise(image: np.ndarray) -> np.ndarray:
+        for function, parameter in chain:
+            image = function(image, parameter)
+        return image
+    return denoise
+
+
 class CleanDifference(Module):
     def __init__(self):
         super().__init__()
         self.foregrounds_in = Input(data_type=MultiImage, config_keys=['cam_ids'])
         self.diff_out = Output(data_type=MultiImage, config_keys=['cam_ids'])
         self.cam_ids = ModuleParameter(None, data_type=list)
+        # see DENOISE_STEPS, compare variants with benchmarks/denoise_chains.py
+        self.denoise_chain = ModuleParameter(DEFAULT_DENOISE_CHAIN, data_type=list)
         self.cut_defaults = {0: 0.8, 1: 0.5}
 
         # cv.namedWindow(self.module_name)
 
+    def configure(self,
+                  denoise_chain: List[str] = None):
+        self._configure(locals())
+
     def _configure(self, config: dict, **kwargs):
         super()._configure(config, **kwargs)
+        # fail early on a broken chain
+        build_denoise_chain(tuple(self.denoise_chain))
         # create_trackbar(self,
         #                 self.cam_ids, self.module_name, 'image_cut',
         #                 cam_defaults=self.cut_defaults, default=0.5,
         #                 min_value=0.0, max_value=1.0, steps=100)
 
     def process_foregrounds_in(self, fgs: MultiImage):
-
-        images = []
-        for fg in fgs.images:
-            # cv.rectangle(fg, (0, int(fg.shape[0] * getattr(self, 'image_cut_%s' % fg.camera_info['name']))),
-            #              (fg.shape[1], fg.shape[0]), (0, 0, 0), cv.FILLED)
-            diff = cv.bilateralFilter(fg, 11, 57, 57)
-
-            kernel = np.ones((3, 3), np.uint8)
-            opened = cv.morphologyEx(diff, cv.MORPH_OPEN, kernel)
-            opened = cv.morphologyEx(opened, cv.MORPH_CLOSE, kernel)
-            opened = cv.threshold(opened, 5, 255, cv.THRESH_BINARY)[1]
-            images.append(CVImage(opened, fg.id, fg.camera_info))
-        # Module.show_image(self.module_name, resize(CVImage(opened, fg.id, fg.camera_info), 0.4))
+        images = CameraExecutor.shared().map(lambda fg: self.clean(fg, self.denoise_chain), fgs.images)
+        # Module.show_image(self.module_name, resize(images[-1], 0.4))
         self.diff_out.data_ready(MultiImage(images))
 
-
+    @staticmethod
+    def clean(fg: CVImage, denoise_chain: List[str] = None) -> CVImage:
+        """
+        denoises the foreground mask, most steps work in-place on the received buffer
+        """
+        # cv.rectangle(fg, (0, int(fg.shape[0] * getattr(self, 'image_cut_%s' % fg.camera_info['name']))),
+        #              (fg.shape[1], fg.shape[0]), (0, 0, 0), cv.FILLED)
+        denoise = build_denoise_chain(tuple(denoise_chain or DEFAULT_DENOISE_CHAIN))
+        return CVImage(denoise(np.asarray(fg)), fg.id, fg.camera_info)
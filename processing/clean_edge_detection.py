@@ -0,0 +1,57 @@
+from typing import List
+
+from core.helper import ModuleParameter
+from core.module import Module, Input, Output
+from core.datatypes import CVImage, MultiImage, ContourCollection
+from core.parallel import CameraExecutor
+from processing.clean_difference import CleanDifference, DEFAULT_DENOISE_CHAIN, build_denoise_chain
+from processing.edge_detection import EdgeDetection
+
+
+class CleanEdgeDetection(Module):
+    """
+    CleanDifference and EdgeDetection fused into a single module: every camera is cleaned and searched for
+    contours by one worker on one buffer, which saves a queue hop and a deep copy of the foregrounds per event.
+    The intermediate images are debug outputs, they are only published if somebody is listening.
+    """
+    def __init__(self):
+        super().__init__()
+        self.foregrounds_in = Input(data_type=MultiImage, config_keys=['cam_ids'])
+        self.diff_out = Output(data_type=MultiImage, config_keys=['cam_ids'], debug=True)
+        self.edged_out = Output(data_type=MultiImage, config_keys=['cam_ids'], debug=True)
+        self.contours_out = Output(data_type=ContourCollection, config_keys=['cam_ids'])
+        self.edge_limit = ModuleParameter(int(1080/20), data_type=int)
+        self.denoise_chain = ModuleParameter(DEFAULT_DENOISE_CHAIN, data_type=list)
+        self.cam_ids = ModuleParameter(None, data_type=list)
+
+    def configure(self,
+                  denoise_chain: List[str] = None,
+                  edge_limit: int = None):
+        self._configure(locals())
+
+    def _configure(self, config: dict, **kwargs):
+        super()._configure(config, **kwargs)
+        build_denoise_chain(tuple(self.denoise_chain))
+
+    def process_foregrounds_in(self, fgs: MultiImage):
+        results = CameraExecutor.shared().map(self.clean_and_detect, fgs.images)
+
+        # contours first, they are on the critical path
+        self.contours_out.data_ready(ContourCollection([contours for _, _, contours in results
+                                                        if contours is not None]))
+        # the debug images keep the topics of the former CleanDifference and EdgeDetection modules
+        self.diff_out.data_ready_lazy(lambda: MultiImage([self.with_topic(diff, 'CleanDifference')
+                                                          for diff, _, _ in results]))
+        self.edged_out.data_ready_lazy(lambda: MultiImage([
+            self.with_topic(EdgeDetection.draw_contour_boxes(edged, contours), 'EdgeDetection')
+            for _, edged, contours in results]))
+
+    @staticmethod
+    def with_topic(image: CVImage, topic: str) -> CVImage:
+        # diff, edge image and contours share one camera_info, never set the topic on it
+        return CVImage(image, image.id, dict(image.camera_info, topic=topic))
+
+    def clean_and_detect(self, fg: CVImage):
+        diff = CleanDifference.clean(fg, self.denoise_chain)
+        edged, contours = EdgeDetection.find_contours(diff, self.edge_limit)
+        return diff, edged, contours
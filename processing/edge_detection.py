@@ -3,15 +3,17 @@ import numpy as np
 
 from core.helper import ModuleParameter
 from core.module import Module, Input, Output
+from core.contour_features import ContourFeatures
 from core.datatypes import CVImage, Contours, MultiImage, ContourCollection
 from core.convenience import resize
+from core.parallel import CameraExecutor
 import cv2 as cv
 
 class EdgeDetection(Module):
     def __init__(self):
         super().__init__()
         self.diff_in = Input(data_type=MultiImage, config_keys=['cam_ids'])
-        self.edged_out = Output(data_type=MultiImage, config_keys=['cam_ids'])
+        self.edged_out = Output(data_type=MultiImage, config_keys=['cam_ids'], debug=True)
         self.contours_out = Output(data_type=ContourCollection, config_keys=['cam_ids'])
         self.edge_limit = ModuleParameter(int(1080/20), data_type=int)
 
@@ -26,32 +28,35 @@ class EdgeDetection(Module):
         self.edge_limit = val
 
     def process_diff_in(self, diffs: MultiImage):
-        images = []
-        contour_collection = []
-        for diff in diffs.images:
-            edged = cv.Canny(diff, 255 / 3, 255)
-            cnts = imutils.grab_contours(cv.findContours(edged.copy(), cv.RETR_EXTERNAL, cv.CHAIN_APPROX_SIMPLE))
-            contours = [c for c in cnts if self.v_diff(c) > self.edge_limit]  # diff.shape[0]/20]
-            largest = sorted(contours, key=self.a_len, reverse=True)[:10]
-            if largest:
-                # contour = self.a_len(largest[0])
-                contour_collection.append(Contours(contours, diff.id, diff.camera_info))
-            edged_c = cv.cvtColor(edged, cv.COLOR_GRAY2BGR)
-            for cnt in contours:
-                rect = cv.minAreaRect(cnt)
-                box = cv.boxPoints(rect)
-                box = np.int0(box)
-                cv.drawContours(edged_c, [box], 0, (0, 0, 255), 2)
-            # Module.show_image("edged", resize(CVImage(edged, diff.id, diff.camera_info), 0.3))
-            images.append(CVImage(edged, diff.id, diff.camera_info))
+        results = CameraExecutor.shared().map(lambda diff: self.find_contours(diff, self.edge_limit), diffs.images)
+        contour_collection = [contours for _, contours in results if contours is not None]
 
-        self.edged_out.data_ready(MultiImage(images))
         self.contours_out.data_ready(ContourCollection(contour_collection))
+        self.edged_out.data_ready_lazy(lambda: MultiImage([self.draw_contour_boxes(edged, contours)
+                                                           for edged, contours in results]))
 
     @staticmethod
-    def v_diff(c):
-        return max([p[0][1] for p in c]) - min([p[0][1] for p in c])
+    def draw_contour_boxes(edged: CVImage, contours: Contours) -> CVImage:
+        edged_c = cv.cvtColor(edged, cv.COLOR_GRAY2BGR)
+        if contours is not None:
+            for cnt in contours.contours:
+                rect = cv.minAreaRect(cnt)
+                box = cv.boxPoints(rect)
+                box = np.intp(box)
+                cv.drawContours(edged_c, [box], 0, (0, 0, 255), 2)
+        # Module.show_image("edged", resize(CVImage(edged, diff.id, diff.camera_info), 0.3))
+        return CVImage(edged_c, edged.id, edged.camera_info)
 
     @staticmethod
-    def a_len(c):
-        return cv.arcLength(c, True)
+    def find_contours(diff: CVImage, edge_limit: int):
+        """
+        :return: the edge image and the contours with a vertical extent above edge_limit (None if there are none)
+        """
+        edged = cv.Canny(diff, 255 / 3, 255)
+        # findContours does not modify its source since OpenCV 3.2, no need to copy the edge image
+        cnts = imutils.grab_contours(cv.findContours(edged, cv.RETR_EXTERNAL, cv.CHAIN_APPROX_SIMPLE))
+        features = ContourFeatures.of(cnts)
+        keep = np.flatnonzero(features.v_extent > edge_limit)  # diff.shape[0]/20]
+        contours = [cnts[i] for i in keep]
+        return CVImage(edged, diff.id, diff.camera_info), \
+            Contours(contours, diff.id, diff.camera_info, features.select(keep)) if contours else None
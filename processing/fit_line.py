@@ -1,4 +1,3 @@
-from collections import OrderedDict
 from threading import Lock
 from typing import List
 
@@ -6,6 +5,9 @@ import numpy as np
 
 from core.helper import ModuleParameter, create_trackbar
 from core.module import Module, Input, Output
+from core.frame_store import FrameStore
+from core.line_fitting import best_vertical_line
+from core.undistortion import UndistortionTable
 from core.datatypes import CVImage, Contours, ImpactPoint, ImpactPoints, ContourCollection, MultiImage
 from core.convenience import resize
 import cv2 as cv
@@ -15,78 +17,75 @@ class FitLine(Module):
     def __init__(self):
         super().__init__()
         self.impact_points_out = Output(data_type=ImpactPoints, config_keys=['cam_ids'])
-        self.raw_images_in = Input(data_type=MultiImage, config_keys=['cam_ids'])
         self.contour_collection_in = Input(data_type=ContourCollection, config_keys=['cam_ids'])
-        self.debug_images_out = Output(data_type=MultiImage, config_keys=['cam_ids'])
-        self.raw_multis = OrderedDict()
+        self.debug_images_out = Output(data_type=MultiImage, config_keys=['cam_ids'], debug=True)
         self.cam_ids = ModuleParameter(None, data_type=list)
+        # number of contours (longest first) that are fitted to find the dart
+        self.candidates = ModuleParameter(5, data_type=int)
+        # rms residual (in pixels) at which the quality of a fit has dropped to 1/e, both edges of a dart count
+        self.residual_scale = ModuleParameter(5.0, data_type=float)
 
         # cv.namedWindow(self.module_name)
 
-    def process_raw_images_in(self, raw_images):
-        self.raw_multis[raw_images.images[0].id] = raw_images
-        # prevent memory leak
-        while len(self.raw_multis) > 10:
-            self.raw_multis.popitem(False)
-
     def process_contour_collection_in(self, contour_collection):
         if not contour_collection.collection:
             self.log_error('NOT ENOUGH CONTOURS!!!!!!!!!!!!!!!!!!!!!!!')
             return
-        image_id = contour_collection.collection[0].image_id
-        if image_id not in self.raw_multis:
-            self.log_error('raw image not found!!!!!!!!!!!!!!!!!!!')
-            return
-        raw_multi_images = self.raw_multis[contour_collection.collection[0].image_id]
         impact_points = []
-        images = []
-        raw_images = {image.cam_id(): image for image in raw_multi_images.images}
-        self.log_debug(list(raw_images.keys()))
+        fits = []
         for contours in contour_collection.collection:
-            raw_image = raw_images[contours.camera_info['name']]
-            roi = contours.camera_info['roi']
-            largest = sorted(contours.contours, key=self.a_len, reverse=True)[:10]
-
-            def board_intersect(_line, board_surface_y):
-
-                a = _line[2]
-                b = _line[3]
-                c = _line[0]
-                d = _line[1]
-                intersect_x = int(c * ((board_surface_y-b)/d) + a)
-
-                return intersect_x, board_surface_y
-
-            # todo: make sure we always pick the right contour
-            for i, contour in enumerate(largest[:1]):
-                line = cv.fitLine(contour, cv.DIST_L2, 0, 0.01, 0.01)
-                line[2] += roi[0]
-                line[3] += roi[1]
-
-                vx = line[0]
-                vy = line[1]
-                x = line[2]
-                y = line[3]
-
-                point1 = (x - vx * 5000, y - vy * 5000)
-                point2 = (x + vx * 5000, y + vy * 5000)
-                board_y = min([p[1] for p in contour[0]]) + roi[1]
-
-                cv.line(raw_image, point1, point2, (0, 0, 255), 1)
-                cv.circle(raw_image, board_intersect(line, board_y), 7, (255, 255, 0))
-                cv.rectangle(raw_image, tuple(roi[:2]), (roi[0]+roi[2], roi[1]+roi[3]), (0,0,255))
-                impact_points.append(ImpactPoint(board_intersect(line, board_y), contours.image_id, contours.camera_info))
-            images.append(CVImage(raw_image, contours.image_id, contours.camera_info))
-
-            # for raw_image in images:
-            #     Module.show_image(self.module_name, resize(raw_image, 0.5))
+            line, impact_point = self.best_fit(contours)
+            self.log_debug('cam', contours.camera_info['name'], 'impact', impact_point.point,
+                           'confidence %.2f' % impact_point.confidence)
+            impact_points.append(impact_point)
+            fits.append((contours, line, impact_point))
 
         self.impact_points_out.data_ready(ImpactPoints(impact_points))
-        self.debug_images_out.data_ready(MultiImage(images))
+        self.debug_images_out.data_ready_lazy(lambda: self.draw_fits(fits))
+
+    def best_fit(self, contours: Contours):
+        """
+        picks the dart among the longest contours (see best_vertical_line)
+        :return: the line (vx, vy, x, y) in image coordinates and the impact point at the top end of the contour
+        """
+        roi = contours.camera_info['roi']
+        # only the contour points are undistorted, in image coordinates
+        points = contours.points + np.asarray(roi[:2], np.int32)
+        undistortion = UndistortionTable.for_camera(contours.camera_info)
+        if undistortion is not None:
+            points = undistortion.undistort(points)
+        _, a, b, board_y, confidence = best_vertical_line(points, contours.offsets, contours.features,
+                                                          self.candidates, self.residual_scale)
+        impact_x = a * board_y + b
+        line = np.array([a, 1, impact_x, board_y], np.float32)
+        line[:2] /= np.sqrt(1 + a * a)
+        return line, ImpactPoint((int(impact_x), int(board_y)), contours.image_id, contours.camera_info, confidence)
+
+    def draw_fits(self, fits) -> MultiImage:
+        image_id = fits[0][0].image_id if fits else None
+        raw_multi_images = FrameStore.shared().get(image_id)
+        if raw_multi_images is None:
+            self.log_error('raw image not found!!!!!!!!!!!!!!!!!!!', FrameStore.shared().metrics())
+            return MultiImage([])
+        raw_images = {image.cam_id(): image for image in raw_multi_images.images}
+        return MultiImage([self.draw_fit(raw_images[contours.camera_info['name']], contours, line, impact_point)
+                           for contours, line, impact_point in fits])
 
     @staticmethod
-    def a_len(c):
-        return cv.arcLength(c, True)
-
-
-
+    def draw_fit(raw_image: CVImage, contours: Contours, line, impact_point: ImpactPoint) -> CVImage:
+        if raw_image.ndim == 2:
+            # grayscale processing: draw the debug lines in colour anyway
+            raw_image = cv.cvtColor(raw_image, cv.COLOR_GRAY2BGR)
+        else:
+            # the stored frame is shared
+            raw_image = raw_image.copy()
+        roi = contours.camera_info['roi']
+        vx, vy, x, y = line
+        point1 = (int(x - vx * 5000), int(y - vy * 5000))
+        point2 = (int(x + vx * 5000), int(y + vy * 5000))
+
+        cv.line(raw_image, point1, point2, (0, 0, 255), 1)
+        cv.circle(raw_image, tuple(int(v) for v in impact_point.point), 7, (255, 255, 0))
+        cv.rectangle(raw_image, tuple(roi[:2]), (roi[0]+roi[2], roi[1]+roi[3]), (0,0,255))
+        # Module.show_image(self.module_name, resize(raw_image, 0.5))
+        return CVImage(raw_image, contours.image_id, contours.camera_info)
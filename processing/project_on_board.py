@@ -11,6 +11,9 @@ from core.constants import RADIUS_INNER_BULL_MM, RADIUS_OUTER_BULL_MM, RADIUS_IN
 from core.helper import ModuleParameter
 from core.module import Module, Input, Output
 from core.datatypes import CVImage, ImpactPoints, BoardCoordinate
+from core.calibration_store import CalibrationStore
+from core.camera_model import CameraModel, intersect_rays, DEFAULT_MOUNT_ANGLES, DEFAULT_CAMERA_DISTANCE_MM
+from core.scoring import ScoreRaster
 from core.convenience import resize
 import cv2 as cv
 
@@ -18,6 +21,13 @@ COLOR_LIGHT = (0.8, 0.8, 0.8)
 COLOR_DARK = (0.1, 0.1, 0.1)
 COLOR_DARK_MULTI = (0.1, 0.1, 0.7)
 COLOR_LIGHT_MULTI = (0.1, 0.6, 0.0)
+COLOR_WIRE = (1, 1, 1)
+# the board is rendered as uint8, colours are given in [0, 2]
+COLOR_SCALE = 255 / 2.
+
+
+def scaled(color):
+    return tuple(int(c * COLOR_SCALE) for c in color)
 
 
 
@@ -27,29 +37,64 @@ class ProjectOnBoard(Module):
         self.sector_angle = 2 * math.pi / 20
         self.sector_degrees = 360/20
         self.impact_points_in = Input(data_type=ImpactPoints, config_keys=['cam_ids'])
+        # the rendered hit belongs to the result, it is rendered whenever connected, not at the debug frame rate
         self.dartboard_out = Output(data_type=CVImage)
         self.coordinate_out = Output(data_type=BoardCoordinate)
 
-        self.background = None
         self.curr_id = None
         self.factor = 1
         self.center = int(500*self.factor)
         self.cam_ids = ModuleParameter(None, data_type=list)
 
-        self.cached_bg = CVImage(np.zeros((self.center*2, self.center*2, 3)), None, None)
-
-        self.draw_dartboard(self.cached_bg)
-
-        self.direction_factors = {
-            0: -1,
-            1: 1,
-            2: 1
-        }
+        # the static board is rendered once, only the overlay is drawn per impact
+        background = np.zeros((self.center*2, self.center*2, 3), np.uint8)
+        self.draw_dartboard(background)
+        self.crop_start = int(self.center - self.factor * RADIUS_BOARD_MM * 1.2)
+        crop_end = int(self.center + self.factor * RADIUS_BOARD_MM * 1.2)
+        self.board_image = np.ascontiguousarray(background[self.crop_start:crop_end, self.crop_start:crop_end])
+
+        self.score_raster = None
+
+        self.mount_angles = ModuleParameter(DEFAULT_MOUNT_ANGLES, data_type=dict)
+        self.camera_distance = ModuleParameter(DEFAULT_CAMERA_DISTANCE_MM)
+        # cam_id -> (calibration version, CameraModel), dropped by the calibration store on every calibration change
+        self.camera_models = {}
+        self.calibration_store = None
+
+    def configure(self,
+                  mount_angles: dict = None,
+                  camera_distance: float = None):
+        self._configure(locals())
+        self.camera_models = {}
+
+    def _configure(self, config: dict, **kwargs):
+        super()._configure(config, **kwargs)
+        # cam_ids arrive from upstream, fail at configuration time instead of on the first impact
+        self.check_mount_angles()
+
+    def check_mount_angles(self):
+        missing = [cam_id for cam_id in (self.cam_ids or []) if cam_id not in self.mount_angles]
+        if missing:
+            raise ValueError('no mount angle configured for camera(s) %s, configure mount_angles for all cameras '
+                             '(configured: %s)' % (', '.join(map(str, missing)), self.mount_angles))
+
+    def __custom_pre_start__(self):
+        self.check_mount_angles()
+        self.score_raster = ScoreRaster.shared()
+        self.calibration_store = CalibrationStore.shared()
+        self.calibration_store.subscribe(self.on_calibration_changed)
+
+    def __stop__(self):
+        if self.calibration_store is not None:
+            self.calibration_store.unsubscribe(self.on_calibration_changed)
+
+    def on_calibration_changed(self, cam_id: int, values: dict, version: int):
+        self.camera_models.pop(cam_id, None)
 
     def draw_dartboard(self, background):
         for i in range(20):
-            color = [COLOR_DARK, COLOR_LIGHT][i % 2]
-            color_multi = [COLOR_DARK_MULTI, COLOR_LIGHT_MULTI][i % 2]
+            color = scaled([COLOR_DARK, COLOR_LIGHT][i % 2])
+            color_multi = scaled([COLOR_DARK_MULTI, COLOR_LIGHT_MULTI][i % 2])
             # DOUBLES
             cv.ellipse(background, (self.center, self.center),
                        (int(self.factor * RADIUS_OUTER_DOUBLE_MM), int(self.factor * RADIUS_OUTER_DOUBLE_MM)),
@@ -86,7 +131,7 @@ class ProjectOnBoard(Module):
                         int(self.center + int(self.factor * RADIUS_OUTER_DOUBLE_MM) * math.sin((0.5 + i - 6) *
                                                                                                self.sector_angle))
                      ),
-                    (1, 1, 1), 1)
+                    scaled(COLOR_WIRE), 1)
 
             cv.putText(background, str(FIELDS[i]),
                        (
@@ -96,113 +141,87 @@ class ProjectOnBoard(Module):
                                int(self.factor * (RADIUS_OUTER_DOUBLE_MM + 20)) * math.sin((i - 6) * self.sector_angle))
                        ),
                        cv.FONT_HERSHEY_DUPLEX,
-                       1, (1, 1, 1))
+                       1, scaled(COLOR_WIRE))
 
         # OUTER BULL
         cv.ellipse(background, (self.center, self.center),
                    (int(self.factor * RADIUS_OUTER_BULL_MM), int(self.factor * RADIUS_OUTER_BULL_MM)),
                    0.0, 0, 360,
-                   COLOR_LIGHT_MULTI, thickness=-1)
+                   scaled(COLOR_LIGHT_MULTI), thickness=-1)
         # INNER BULL
         cv.ellipse(background, (self.center, self.center),
                    (int(self.factor * RADIUS_INNER_BULL_MM), int(self.factor * RADIUS_INNER_BULL_MM)),
                    0.0, 0, 360,
-                   COLOR_DARK_MULTI, thickness=-1)
+                   scaled(COLOR_DARK_MULTI), thickness=-1)
         # outer rim:
         cv.circle(background, (self.center, self.center), int(self.factor * RADIUS_BOARD_MM),
-                  (1, 1, 1), 2)
+                  scaled(COLOR_WIRE), 2)
         cv.circle(background, (self.center, self.center), int(self.factor * RADIUS_OUTER_DOUBLE_MM),
-                  (1, 1, 1), 1)
+                  scaled(COLOR_WIRE), 1)
         cv.circle(background, (self.center, self.center), int(self.factor * RADIUS_INNER_DOUBLE_MM),
-                  (1, 1, 1), 1)
+                  scaled(COLOR_WIRE), 1)
         cv.circle(background, (self.center, self.center), int(self.factor * RADIUS_OUTER_TRIPLE_MM),
-                  (1, 1, 1), 1)
+                  scaled(COLOR_WIRE), 1)
         cv.circle(background, (self.center, self.center), int(self.factor * RADIUS_INNER_TRIPLE_MM),
-                  (1, 1, 1), 1)
+                  scaled(COLOR_WIRE), 1)
         cv.circle(background, (self.center, self.center), int(self.factor * RADIUS_OUTER_BULL_MM),
-                  (1, 1, 1), 1)
+                  scaled(COLOR_WIRE), 1)
         cv.circle(background, (self.center, self.center), int(self.factor * RADIUS_INNER_BULL_MM),
-                  (1, 1, 1), 1)
-
-    def redraw_bg(self, impact_point):
-        self.background = self.cached_bg.copy()
-        ci = {k: v for k, v in impact_point.camera_info.items()}
-        ci['name'] = 0
-        self.background = self.cached_bg.copy()
-        self.background.id = impact_point.image_id
-        self.background.camera_info = ci
-
-    @staticmethod
-    def line_intersection(line1, line2):
-        xdiff = (line1[0][0] - line1[1][0], line2[0][0] - line2[1][0])
-        ydiff = (line1[0][1] - line1[1][1], line2[0][1] - line2[1][1])
-
-        def det(a, b):
-            return a[0] * b[1] - a[1] * b[0]
-
-        div = det(xdiff, ydiff)
-        if div == 0:
-            raise Exception('lines do not intersect')
-
-        d = (det(*line1), det(*line2))
-        x = det(d, xdiff) / div
-        y = det(d, ydiff) / div
-        return x, y
+                  scaled(COLOR_WIRE), 1)
+
+    def camera_model(self, camera_info) -> CameraModel:
+        """
+        :return: the model of the camera, only rebuilt after the calibration changed
+        """
+        cam_id = camera_info['name']
+        cached = self.camera_models.get(cam_id)
+        # the version check catches models built from a record that was replaced while building
+        if cached is None or cached[0] != self.calibration_store.version:
+            # built from the current calibration, frames annotated before a change may still carry the old one
+            frame_calibration = camera_info['calibration']
+            calibration = self.calibration_store.record(cam_id, frame_calibration.width, frame_calibration.height)
+            cached = (calibration.version,
+                      CameraModel.from_camera_info(camera_info, self.mount_angles, self.camera_distance, calibration))
+            self.camera_models[cam_id] = cached
+        return cached[1]
 
     def process_impact_points_in(self, impact_points):
 
-        self.redraw_bg(impact_points.points[0])
-
         lines = {}
+        rays = []
 
         for impact_point in impact_points.points:
-
-            cam_id = impact_point.camera_info['name']
-
-            w = 1920
-
-            # pixel-coordinates
-            camera_center = w/2
-            impact_x = (impact_point.point[0] - camera_center) * self.direction_factors[cam_id]
-            bull_offset = (impact_point.camera_info['bull'] - camera_center) * self.direction_factors[cam_id]
-
-            radius = impact_point.camera_info['radius']
-            conversion_factor = RADIUS_OUTER_DOUBLE_MM / float(radius)
-
-            # mm
-            cam_dist_board_center = 460
-            bull_offset_mm = bull_offset * conversion_factor
-            impact_mm = impact_x * conversion_factor
-
-            p_1 = (-cam_dist_board_center, bull_offset_mm) if cam_id == 0 else (bull_offset_mm, -cam_dist_board_center)
-            p_2 = (0, impact_mm-bull_offset_mm) if cam_id == 0 else (impact_mm-bull_offset_mm, 0)
-
-            lines[cam_id] = (p_1, p_2)
-
-            cv.line(self.background,
-                    (int(p_1[0]+self.center), int(p_1[1]+self.center)),
-                    (int((2*p_2[0]-p_1[0])+self.center), int((2*p_2[1]-p_1[1])+self.center)),
-                    (1, 0, 0) if cam_id == 1 else (1, 1, 0), 1)
+            model = self.camera_model(impact_point.camera_info)
+            origin, direction = model.ray(impact_point.point[0])
+            rays.append((origin, direction, max(impact_point.confidence, 1e-3)))
+            lines[impact_point.camera_info['name']] = (origin, model.targets(impact_point.point[0]))
 
         if len(lines.keys()) < 2:
             self.log_debug('NOT ENOUGH LINES!')
             return
-        intersection = self.line_intersection(lines[0], lines[1])
+        origins, directions, weights = (np.array(values) for values in zip(*rays))
+        intersection = intersect_rays(origins, directions, weights)
         board_coordinate = (int(intersection[0] + RADIUS_OUTER_DOUBLE_MM),
                             int(intersection[1] + RADIUS_OUTER_DOUBLE_MM))
-        display_coordinate = (int(intersection[0]+self.center),
-                            int(intersection[1] + self.center))
-        cv.circle(self.background, display_coordinate, 4, (0.5, 0, 1), thickness=2)
-        self.log_info('BOARD-COORDINATE:', board_coordinate)
-        self.coordinate_out.data_ready(BoardCoordinate(board_coordinate))
-        self.background.camera_info['topic'] = 'dartboard'
-        self.log_debug(self.background.shape, self.background.camera_info, self.background.id)
-
-        self.dartboard_out.data_ready(CVImage(np.uint8((np.array(self.background[
-                                                    int(self.center - self.factor * RADIUS_BOARD_MM * 1.2):
-                                                        int(self.center + self.factor * RADIUS_BOARD_MM * 1.2),
-                                                    int(self.center - self.factor * RADIUS_BOARD_MM * 1.2):
-                                                        int(self.center + self.factor * RADIUS_BOARD_MM * 1.2)
-                                                    ]))*255/2.), '0000', {'name': 0, 'topic': 'dartboard'}))
-
-
+        # score the exact intersection, not the rounded coordinate
+        segment, multiplier = self.score_raster.lookup(intersection[0] + RADIUS_OUTER_DOUBLE_MM,
+                                                       intersection[1] + RADIUS_OUTER_DOUBLE_MM)
+        self.log_info('BOARD-COORDINATE:', board_coordinate, 'SCORE: %d x %d' % (multiplier, segment))
+        self.coordinate_out.data_ready(BoardCoordinate(board_coordinate, int(segment), int(multiplier)))
+        self.dartboard_out.data_ready_lazy(lambda: self.render_dartboard(impact_points.points[0], lines, intersection))
+
+    def render_dartboard(self, impact_point, lines, intersection):
+        """
+        draws the camera rays and the hit onto a copy of the pre-rendered board
+        """
+        dartboard = self.board_image.copy()
+        offset = self.center - self.crop_start
+        for cam_id, (p_1, p_2) in lines.items():
+            cv.line(dartboard,
+                    (int(p_1[0]+offset), int(p_1[1]+offset)),
+                    (int((2*p_2[0]-p_1[0])+offset), int((2*p_2[1]-p_1[1])+offset)),
+                    scaled((1, 0, 0) if cam_id == 1 else (1, 1, 0)), 1)
+        display_coordinate = (int(intersection[0]+offset),
+                              int(intersection[1]+offset))
+        cv.circle(dartboard, display_coordinate, 4, scaled((0.5, 0, 1)), thickness=2)
+        return CVImage(dartboard, impact_point.image_id, {'name': 0, 'topic': 'dartboard'})
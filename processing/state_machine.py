@@ -9,7 +9,6 @@ from core.helper import ModuleParameter, create_trackbar
 from core.module import Module, Input, Output
 from core.datatypes import CVImage, Contours, ImpactPoint, SetBackgroundTrigger, ContourCollection
 from core.convenience import resize
-import cv2 as cv
 
 
 class DARTS_STATES(Enum):
@@ -40,10 +39,8 @@ class StateMachine(Module):
         self.matches = {}
 
     def process_contours_in(self, contours):
-        largest = sorted(contours.contours, key=self.a_len, reverse=True)[:10]
-
-        if largest:
-            ll = self.a_len(largest[0])
+        if len(contours.features):
+            ll = contours.features.arc_length.max()
             # STATE_PROGRESSION
             if self.internal_state == DARTS_STATES.IDLE:
                 self.internal_state = DARTS_STATES.DART_1
@@ -99,9 +96,4 @@ class StateMachine(Module):
                 self.log_debug('NO CONTOURS', '->', self.internal_state)
 
 
-    @staticmethod
-    def a_len(c):
-        return cv.arcLength(c, True)
-
-
 
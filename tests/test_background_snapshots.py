@@ -0,0 +1,44 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from core.datatypes import CVImage, SetBackgroundTrigger
+from processing.background_subtraction import BackgroundSubtraction
+
+
+class BackgroundSnapshotTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.module = BackgroundSubtraction()
+        self.module.cam_ids = [0]
+        self.module.configure(snapshot_directory=self.directory.name, background_model='running_average',
+                              event_background_model='running_average')
+        self.module.get_bg_sub()
+        board = np.full((24, 32), 100, dtype=np.uint8)
+        for stream in ['0', 'EVENT_0']:
+            name = 0 if stream == '0' else stream
+            for frame_id in range(self.module.min_amount_of_initial_images):
+                self.module.add_background(CVImage(board, frame_id, {'name': name}))
+            self.module.latest_streams[name] = CVImage(board, frame_id, {'name': name})
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def snapshots(self):
+        return sorted(os.listdir(self.directory.name))
+
+    def test_snapshot_is_written(self):
+        self.module.snapshot_backgrounds()
+        self.assertEqual(self.snapshots(), ['0.png', 'EVENT_0.png'])
+
+    def test_snapshot_is_written_while_temporary_subtraction_is_active(self):
+        self.module.process_set_background_trigger_in(SetBackgroundTrigger(dart_number=1))
+        self.assertTrue(self.module.temp_subtraction_active)
+        self.module.snapshot_backgrounds()
+        self.assertEqual(self.snapshots(), ['0.png', 'EVENT_0.png'])
+
+
+if __name__ == '__main__':
+    unittest.main()
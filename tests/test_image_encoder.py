@@ -0,0 +1,55 @@
+import unittest
+
+import numpy as np
+
+from core.datatypes import CVImage
+from network.image_encoder import ImageEncoder
+from network.mqtt_client import MQTTClient
+from network.mqtt_publisher import MQTTPublisher
+
+
+class CountingEncoder(ImageEncoder):
+    def __init__(self):
+        super().__init__(max_workers=1)
+        self.encodes = 0
+
+    def encode(self, image, settings):
+        self.encodes += 1
+        return ImageEncoder.encode(image, settings)
+
+
+class ImageEncoderTest(unittest.TestCase):
+    def setUp(self):
+        self.client = MQTTClient()
+        self.client.encoder = CountingEncoder()
+        # never started, published messages stay queued
+        self.client.publisher = MQTTPublisher(None)
+
+    def tearDown(self):
+        self.client.encoder.shutdown()
+
+    def test_image_published_to_several_topics_is_encoded_once(self):
+        image = CVImage(np.zeros((48, 64, 3), np.uint8), 'frame', {'name': 0})
+        self.assertEqual(self.client.encoder.settings('a/0'), self.client.encoder.settings('b/0'))
+
+        self.client.publish_image('a/0', image, 'CleanEdgeDetection')
+        self.client.publish_image('b/0', image, 'CleanEdgeDetection')
+        self.client.encoder.shutdown(wait=True)
+
+        self.assertEqual(self.client.encoder.encodes, 1)
+        self.assertEqual(self.client.publisher.metrics()['queued'], 2)
+
+    def test_outputs_of_one_module_are_encoded_separately(self):
+        diff = CVImage(np.zeros((48, 64), np.uint8), 'frame', {'name': 0, 'topic': 'CleanDifference'})
+        edged = CVImage(np.full((48, 64), 255, np.uint8), 'frame', {'name': 0, 'topic': 'EdgeDetection'})
+        settings = self.client.encoder.settings('CleanDifference/0')
+
+        encoded_diff = self.client.encoder.submit(diff, 'CleanEdgeDetection', settings).result()
+        encoded_edged = self.client.encoder.submit(edged, 'CleanEdgeDetection', settings).result()
+
+        self.assertEqual(self.client.encoder.encodes, 2)
+        self.assertNotEqual(encoded_diff, encoded_edged)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+import unittest
+
+from core.datatypes import JsonObject
+from core.module import Output
+
+
+class Recorder(object):
+    def __init__(self):
+        self.received = []
+
+    def add_to_data_queue(self, item, source):
+        self.received.append(item)
+
+
+class OutputRateTest(unittest.TestCase):
+    def connect(self, output: Output) -> Recorder:
+        recorder = Recorder()
+        output._registered_connections.append(recorder)
+        return recorder
+
+    def render(self, output: Output, count: int) -> int:
+        return sum(output.data_ready_lazy(lambda: JsonObject(json_obj='{}', topic='test')) for _ in range(count))
+
+    def test_debug_output_is_limited_to_its_frame_rate(self):
+        output = Output(data_type=JsonObject, debug=True, max_fps=1.0)
+        recorder = self.connect(output)
+        self.assertEqual(self.render(output, 3), 1)
+        self.assertEqual(len(recorder.received), 1)
+
+    def test_debug_output_without_limit(self):
+        output = Output(data_type=JsonObject, debug=True, max_fps=None)
+        self.connect(output)
+        self.assertEqual(self.render(output, 3), 3)
+
+    def test_other_outputs_are_never_limited(self):
+        output = Output(data_type=JsonObject, max_fps=1.0)
+        recorder = self.connect(output)
+        self.assertEqual(self.render(output, 3), 3)
+        self.assertEqual(len(recorder.received), 3)
+
+    def test_unconnected_output_is_not_rendered(self):
+        self.assertEqual(self.render(Output(data_type=JsonObject), 1), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()